@@ -1,11 +1,121 @@
 import streamlit as st
-import yt_dlp
 import os
 import shutil
 import tempfile
+import threading
+import concurrent.futures
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 from utils.drive import upload_file_to_drive, DEFAULT_FOLDER_ID
-from utils.media import process_vocal_removal, mute_video, loop_video, clip_video, replace_audio, mix_audio, image_to_video
+from utils.download import fetch_video_info, download_with_info, safe_filename, build_download_opts, clip_download_section, download_audio_only, download_video_only
+from utils.formats import choose_format
+from utils.pipeline import stream_mute, stream_loop
+from utils.progress import format_event
+from utils.media import VOCAL_REMOVAL_OUTPUTS, process_vocal_removal, preview_vocal_removal, mute_video, loop_video, clip_video, parse_time, replace_audio, mix_audio, image_to_video, images_to_video
+from utils.separation import get_engine, pin_cpu_threads
+
+# Pin torch's CPU threads before the separation engine first imports torch
+pin_cpu_threads()
+
+@st.cache_resource
+def get_separation_engine():
+    """One Demucs engine per server process, shared by all sessions and reruns."""
+    return get_engine()
+
+@st.cache_resource
+def get_separation_worker():
+    """Background worker for full separation runs, so the page stays responsive meanwhile."""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+def vocal_preview_panel(get_source, outputs, key, video_source=None):
+    """
+    Quick 30s spectral preview of the karaoke track, plus a button that starts the full
+    Demucs separation on the background worker.
+
+    Args:
+        get_source (func): Returns the local media path to separate (may download/save it).
+        outputs (list): Outputs for the full run (see process_vocal_removal).
+        key (str): Widget/session key prefix.
+        video_source (str or func, optional): Video for the karaoke MP4 (see process_vocal_removal).
+    """
+    c1, c2 = st.columns(2)
+    if c1.button("🎧 Quick Preview (30s)", key=f"{key}_preview"):
+        with st.spinner("Creating preview..."):
+            source = get_source()
+            st.session_state[f"{key}_preview_files"] = preview_vocal_removal(source, output_dir=tempfile.gettempdir()) if source else None
+        # get_source reports its own errors; only blame the audio when it was actually read
+        if source and not st.session_state[f"{key}_preview_files"]:
+            st.error("❌ Preview not available for this audio (mono or unreadable). Try the full separation.")
+
+    preview = st.session_state.get(f"{key}_preview_files")
+    if preview:
+        st.audio(preview['instrumental'])
+        st.caption("Rough preview (centre-channel removal). The full separation uses the Demucs model.")
+
+    if c2.button("🚀 Full Separation in Background", key=f"{key}_full"):
+        source = get_source()
+        if source:
+            st.session_state[f"{key}_job"] = get_separation_worker().submit(
+                process_vocal_removal, source, video_source=video_source, engine=get_separation_engine(), outputs=outputs
+            )
+
+    # Polls the background job without rerunning the rest of the page
+    @st.fragment(run_every=2)
+    def job_status():
+        job = st.session_state.get(f"{key}_job")
+        if job is None:
+            return
+        if not job.done():
+            st.info("⏳ Separating in the background... you can keep using the page.")
+            return
+        del st.session_state[f"{key}_job"]
+        instrumentals = job.result()
+        if not instrumentals:
+            st.session_state[f"{key}_failed"] = True
+        else:
+            for name, file_key in (('mp3', 'instrumental_mp3'), ('mp4', 'instrumental_mp4'), ('vocals_mp3', 'vocals_mp3')):
+                if name in instrumentals:
+                    st.session_state.processed_files[file_key] = instrumentals[name]
+        st.rerun()  # Show the new files in the results section
+
+    job_status()
+    if st.session_state.pop(f"{key}_failed", False):
+        st.error("❌ Vocal removal failed. See logs.")
+
+def make_progress_callback():
+    """
+    Returns a download progress callback that drives a Streamlit progress bar and status line.
+
+    yt-dlp calls it from its fragment download threads as well, so each calling thread is
+    attached to this script run (Streamlit drops updates from threads without one).
+    """
+    bar = st.progress(0.0)
+    status = st.empty()
+    ctx = get_script_run_ctx()
+    lock = threading.Lock()
+    def on_event(event):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        with lock:
+            if event.get('percent') is not None:
+                bar.progress(min(1.0, event['percent'] / 100.0))
+            status.text(format_event(event))
+    return on_event
+
+VOCAL_OUTPUT_LABELS = {
+    'mp3': "Backing Track (MP3)",
+    'vocals_mp3': "Isolated Vocals (MP3)",
+    'mp4': "Karaoke Video (MP4)",
+}
+
+def select_vocal_outputs(key):
+    """Multiselect for the vocal removal outputs to create (only these are encoded)."""
+    return st.multiselect(
+        "Vocal removal outputs",
+        options=list(VOCAL_REMOVAL_OUTPUTS),
+        default=list(VOCAL_REMOVAL_OUTPUTS),
+        format_func=VOCAL_OUTPUT_LABELS.get,
+        key=key
+    )
 
 def main():
     st.set_page_config(page_title="ytdlr", page_icon="🎥")
@@ -35,11 +145,8 @@ def main():
             # Fetch Info
             if not st.session_state.video_info:
                 with st.spinner("Fetching video info..."):
-                    ydl_opts = {'quiet': True, 'no_warnings': True}
                     try:
-                        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                            info = ydl.extract_info(url, download=False)
-                            st.session_state.video_info = info
+                        st.session_state.video_info = fetch_video_info(url)
                     except Exception as e:
                         st.error(f"Error: {e}")
             
@@ -64,6 +171,10 @@ def main():
                 else:
                     st.info("Best available quality will be downloaded.")
 
+                # Prefer streams that merge into MP4 (and later edits) without transcoding
+                format_choice = choose_format(info, resolution)
+                st.caption(f"🎯 Format: {format_choice['label']} — {format_choice['reason']}")
+
                 # Options
                 c1, c2, c3, c4 = st.columns(4)
                 remove_vocals_yt = c1.checkbox("🎵 Remove Vocals", key="yt_remove_vocals")
@@ -81,46 +192,77 @@ def main():
                     cc1, cc2 = st.columns(2)
                     clip_start_yt = cc1.text_input("Start Time (e.g. 10s)", value="0s", key="yt_clip_start")
                     clip_duration_yt = cc2.text_input("Clip Duration (Empty = End)", value="", key="yt_clip_dur")
+
+                # Vocal removal on its own only needs the audio stream; video is fetched later if wanted
+                vocals_only_yt = remove_vocals_yt and not (mute_video_yt or loop_video_yt or clip_video_yt)
+                vocal_outputs_yt = list(VOCAL_REMOVAL_OUTPUTS)
+                if remove_vocals_yt:
+                    vocal_outputs_yt = select_vocal_outputs("yt_vocal_outputs")
+                    if vocals_only_yt and 'mp4' in vocal_outputs_yt:
+                        st.caption("The karaoke video downloads the video stream after separation.")
+                    if vocals_only_yt:
+                        def get_preview_source():
+                            with st.spinner("Downloading audio..."):
+                                try:
+                                    return download_audio_only(info, safe_filename(info.get('title', 'video')))
+                                except Exception as e:
+                                    st.error(f"❌ Error: {e}")
+                                    return None
+                        video_source_yt = lambda: download_video_only(info, f"{safe_filename(info.get('title', 'video'))}_video", resolution)
+                        vocal_preview_panel(get_preview_source, vocal_outputs_yt, "yt_vocals", video_source=video_source_yt)
                 
                 if st.button("Download & Process", key="yt_process"):
                     with st.spinner(f"Downloading..."):
-                        safe_title = "".join([c for c in info.get('title', 'video') if c.isalpha() or c.isdigit() or c in ' ._-']).rstrip()
-                        if not safe_title: safe_title = "video"
-                        output_filename = f"{safe_title}.mp4"
-                        
-                        if resolution:
-                            format_str = f'bestvideo[height={resolution}]+bestaudio/best[height={resolution}]'
-                        else:
-                            format_str = 'bestvideo+bestaudio/best'
-
-                        ydl_opts_down = {
-                            'format': format_str,
-                            'merge_output_format': 'mp4',
-                            'outtmpl': output_filename,
-                            'quiet': True,
-                        }
+                        download_progress = make_progress_callback()
+                        base_name = safe_filename(info.get('title', 'video'))
+                        output_filename = f"{base_name}.mp4"
+
+                        # If clipping is the only operation, download just the clip window
+                        section = None
+                        clip_only = clip_video_yt and not (remove_vocals_yt or mute_video_yt or loop_video_yt)
+                        mute_only_yt = mute_video_yt and not (remove_vocals_yt or loop_video_yt or clip_video_yt)
+                        loop_only_yt = loop_video_yt and not (remove_vocals_yt or mute_video_yt or clip_video_yt)
+                        if clip_only:
+                            clip_start_s = parse_time(clip_start_yt)
+                            clip_duration_s = parse_time(clip_duration_yt) if clip_duration_yt else None
+                            if clip_start_s is not None and (not clip_duration_yt or clip_duration_s is not None):
+                                section, trim_offset = clip_download_section(clip_start_s, clip_duration_s)
+                                clipped_filename = f"{base_name}_clipped.mp4"
+                                output_filename = f"{base_name}_section.mp4"
+
+                        ydl_opts_down = build_download_opts(output_filename, quiet=True, ignoreerrors=False, section=section, format_str=format_choice['format'], progress=download_progress)
                         
                         try:
-                            # cleanup old
-                            if os.path.exists(output_filename): os.remove(output_filename)
-                            
-                            with yt_dlp.YoutubeDL(ydl_opts_down) as ydl:
-                                ydl.download([url])
-                            
-                            st.success(f"✅ Downloaded: {output_filename}")
-                            # Reset processed files for this new run
-                            st.session_state.processed_files = {'original': output_filename}
-                            
-                            if remove_vocals_yt:
+                            # Mute/loop on their own are produced straight from the source streams
+                            streamed_file = None
+                            if mute_only_yt:
+                                streamed_file = stream_mute(info, f"{base_name}_muted.mp4", resolution)
+                            elif loop_only_yt:
+                                streamed_file = stream_loop(info, target_duration_yt, f"{base_name}_looped.mp4", resolution)
+
+                            if vocals_only_yt:
+                                audio_file = download_audio_only(info, base_name, progress=download_progress)
+                                if not audio_file:
+                                    raise RuntimeError("Audio download failed.")
+                                st.success(f"✅ Downloaded audio: {audio_file}")
+                                st.session_state.processed_files = {}
+
                                 status_text = st.empty()
                                 def progress_callback(msg):
                                     status_text.text(msg)
-                                    
-                                instrumentals = process_vocal_removal(output_filename, progress_callback=progress_callback)
-                                
-                                status_text.empty() # Clear status after done
-                                
+
+                                video_source = None
+                                if 'mp4' in vocal_outputs_yt:
+                                    video_source = lambda: download_video_only(info, f"{base_name}_video", resolution, progress=download_progress)
+                                instrumentals = process_vocal_removal(audio_file, progress_callback=progress_callback, video_source=video_source,
+                                                                      engine=get_separation_engine(), outputs=vocal_outputs_yt)
+
+                                status_text.empty()
+
                                 if instrumentals:
+                                    if 'mp3' in instrumentals:
+                                        st.success(f"✅ Created Instrumental Audio")
+                                        st.session_state.processed_files['instrumental_mp3'] = instrumentals['mp3']
                                     if 'mp4' in instrumentals:
                                         st.success(f"✅ Created Karaoke Video")
                                         st.session_state.processed_files['instrumental_mp4'] = instrumentals['mp4']
@@ -129,33 +271,82 @@ def main():
                                         st.session_state.processed_files['vocals_mp3'] = instrumentals['vocals_mp3']
                                 else:
                                     st.error("❌ Vocal removal failed. See logs.")
-
-                            if mute_video_yt:
-                                with st.spinner("Muting video..."):
-                                    muted_file = mute_video(output_filename)
-                                    if muted_file:
-                                        st.success(f"✅ Created Muted Video")
-                                        st.session_state.processed_files['muted_mp4'] = muted_file
-                                    else:
-                                        st.error("❌ Failed to mute video.")
-                            
-                            if loop_video_yt:
-                                with st.spinner(f"Looping video to {target_duration_yt}..."):
-                                    looped_file = loop_video(output_filename, target_duration_yt)
-                                    if looped_file:
-                                        st.success(f"✅ Created Looped Video ({target_duration_yt})")
-                                        st.session_state.processed_files['looped_mp4'] = looped_file
-                                    else:
-                                        st.error("❌ Failed to loop video.")
+                            elif streamed_file:
+                                if mute_only_yt:
+                                    st.success(f"✅ Created Muted Video")
+                                    st.session_state.processed_files = {'muted_mp4': streamed_file}
+                                else:
+                                    st.success(f"✅ Created Looped Video ({target_duration_yt})")
+                                    st.session_state.processed_files = {'looped_mp4': streamed_file}
+                            else:
+                                # Reuse the cached info dict instead of extracting the URL again.
+                                # Verified earlier downloads are reused and interrupted ones resume.
+                                if not download_with_info(info, ydl_opts_down):
+                                    raise RuntimeError("Download failed.")
                             
-                            if clip_video_yt:
-                                with st.spinner(f"Clipping video ({clip_duration_yt} from {clip_start_yt})..."):
-                                    clipped_file = clip_video(output_filename, clip_start_yt, clip_duration_yt)
+                                if section:
+                                    with st.spinner(f"Clipping video ({clip_duration_yt} from {clip_start_yt})..."):
+                                        clipped_file = clip_video(output_filename, trim_offset, clip_duration_s, clipped_filename)
+                                    os.remove(output_filename)
                                     if clipped_file:
                                         st.success("✅ Created Clipped Video")
-                                        st.session_state.processed_files['clipped_mp4'] = clipped_file
+                                        st.session_state.processed_files = {'clipped_mp4': clipped_file}
                                     else:
                                         st.error("❌ Failed to clip video.")
+                                else:
+                                    st.success(f"✅ Downloaded: {output_filename}")
+                                    # Reset processed files for this new run
+                                    st.session_state.processed_files = {'original': output_filename}
+                            
+                                    if remove_vocals_yt:
+                                        status_text = st.empty()
+                                        def progress_callback(msg):
+                                            status_text.text(msg)
+                                    
+                                        instrumentals = process_vocal_removal(output_filename, progress_callback=progress_callback,
+                                                                              engine=get_separation_engine(), outputs=vocal_outputs_yt)
+                                
+                                        status_text.empty() # Clear status after done
+                                
+                                        if instrumentals:
+                                            if 'mp3' in instrumentals:
+                                                st.success(f"✅ Created Instrumental Audio")
+                                                st.session_state.processed_files['instrumental_mp3'] = instrumentals['mp3']
+                                            if 'mp4' in instrumentals:
+                                                st.success(f"✅ Created Karaoke Video")
+                                                st.session_state.processed_files['instrumental_mp4'] = instrumentals['mp4']
+                                            if 'vocals_mp3' in instrumentals:
+                                                st.success(f"✅ Created Isolated Vocals")
+                                                st.session_state.processed_files['vocals_mp3'] = instrumentals['vocals_mp3']
+                                        else:
+                                            st.error("❌ Vocal removal failed. See logs.")
+
+                                    if mute_video_yt:
+                                        with st.spinner("Muting video..."):
+                                            muted_file = mute_video(output_filename)
+                                            if muted_file:
+                                                st.success(f"✅ Created Muted Video")
+                                                st.session_state.processed_files['muted_mp4'] = muted_file
+                                            else:
+                                                st.error("❌ Failed to mute video.")
+                            
+                                    if loop_video_yt:
+                                        with st.spinner(f"Looping video to {target_duration_yt}..."):
+                                            looped_file = loop_video(output_filename, target_duration_yt)
+                                            if looped_file:
+                                                st.success(f"✅ Created Looped Video ({target_duration_yt})")
+                                                st.session_state.processed_files['looped_mp4'] = looped_file
+                                            else:
+                                                st.error("❌ Failed to loop video.")
+                            
+                                    if clip_video_yt:
+                                        with st.spinner(f"Clipping video ({clip_duration_yt} from {clip_start_yt})..."):
+                                            clipped_file = clip_video(output_filename, clip_start_yt, clip_duration_yt)
+                                            if clipped_file:
+                                                st.success("✅ Created Clipped Video")
+                                                st.session_state.processed_files['clipped_mp4'] = clipped_file
+                                            else:
+                                                st.error("❌ Failed to clip video.")
 
                         except Exception as e:
                             st.error(f"Failed: {e}")
@@ -174,6 +365,16 @@ def main():
             mute_video_up = c2.checkbox("🔇 Mute Video", value=False, key="up_mute_video")
             loop_video_up = c3.checkbox("🔄 Loop Video", value=False, key="up_loop_video")
             clip_video_up = c4.checkbox("✂️ Clip Video", value=False, key="up_clip_video")
+
+            vocal_outputs_up = list(VOCAL_REMOVAL_OUTPUTS)
+            if remove_vocals_up:
+                vocal_outputs_up = select_vocal_outputs("up_vocal_outputs")
+                def get_upload_source():
+                    path = os.path.join(tempfile.gettempdir(), os.path.basename(uploaded_file.name))
+                    with open(path, "wb") as f:
+                        f.write(uploaded_file.getbuffer())
+                    return path
+                vocal_preview_panel(get_upload_source, vocal_outputs_up, "up_vocals")
             
             target_duration_up = "1m"
             clip_start_up = "0s"
@@ -191,21 +392,22 @@ def main():
                 with st.spinner("Processing uploaded file..."):
                     try:
                         # Use original filename
-                        safe_filename = "".join([c for c in uploaded_file.name if c.isalpha() or c.isdigit() or c in ' ._-']).rstrip()
-                        if not safe_filename: safe_filename = "uploaded_video.mp4"
+                        upload_path = "".join([c for c in uploaded_file.name if c.isalpha() or c.isdigit() or c in ' ._-']).rstrip()
+                        if not upload_path: upload_path = "uploaded_video.mp4"
                         
-                        with open(safe_filename, "wb") as f:
+                        with open(upload_path, "wb") as f:
                             f.write(uploaded_file.getbuffer())
                             
-                        st.success(f"✅ Saved: {safe_filename}")
-                        st.session_state.processed_files = {'original': safe_filename}
+                        st.success(f"✅ Saved: {upload_path}")
+                        st.session_state.processed_files = {'original': upload_path}
                         
                         if remove_vocals_up:
                             status_text = st.empty()
                             def progress_callback(msg):
                                 status_text.text(msg)
                                 
-                            instrumentals = process_vocal_removal(safe_filename, progress_callback=progress_callback)
+                            instrumentals = process_vocal_removal(upload_path, progress_callback=progress_callback,
+                                                                  engine=get_separation_engine(), outputs=vocal_outputs_up)
                             
                             status_text.empty()
                             
@@ -224,7 +426,7 @@ def main():
                         
                         if mute_video_up:
                             with st.spinner("Muting video..."):
-                                muted_file = mute_video(safe_filename)
+                                muted_file = mute_video(upload_path)
                                 if muted_file:
                                     st.success(f"✅ Created Muted Video")
                                     st.session_state.processed_files['muted_mp4'] = muted_file
@@ -233,7 +435,7 @@ def main():
                         
                         if loop_video_up:
                             with st.spinner(f"Looping video to {target_duration_up}..."):
-                                looped_file = loop_video(safe_filename, target_duration_up)
+                                looped_file = loop_video(upload_path, target_duration_up)
                                 if looped_file:
                                     st.success(f"✅ Created Looped Video ({target_duration_up})")
                                     st.session_state.processed_files['looped_mp4'] = looped_file
@@ -242,7 +444,7 @@ def main():
                         
                         if clip_video_up:
                             with st.spinner(f"Clipping video ({clip_duration_up} from {clip_start_up})..."):
-                                clipped_file = clip_video(safe_filename, clip_start_up, clip_duration_up)
+                                clipped_file = clip_video(upload_path, clip_start_up, clip_duration_up)
                                 if clipped_file:
                                     st.success("✅ Created Clipped Video")
                                     st.session_state.processed_files['clipped_mp4'] = clipped_file
@@ -285,6 +487,7 @@ def main():
             vol_video = 1.0
             vol_audio = 1.0
             duration_per_image = 3.0
+            crossfade = 0.0
             
             if mode == "Mix Audio":
                 c1, c2 = st.columns(2)
@@ -298,6 +501,7 @@ def main():
             if mode == "Images to Video (Slideshow)":
                 st.info(f"Creating a slideshow from {len(tool_video)} images.")
                 duration_per_image = st.number_input("Duration per Image (seconds)", min_value=0.1, value=3.0, step=0.5)
+                crossfade = st.number_input("Crossfade between Images (seconds, 0 = cut)", min_value=0.0, max_value=duration_per_image, value=0.0, step=0.25)
 
             if st.button(f"🔄 {mode}"):
                 with st.spinner("Processing..."):
@@ -320,7 +524,7 @@ def main():
                                 temp_files.append(t_name)
                             
                             output_path = "processed_slideshow.mp4"
-                            result = images_to_video(image_paths, a_name, duration_per_image, output_path)
+                            result = images_to_video(image_paths, a_name, duration_per_image, output_path, transition=crossfade)
                             key_name = 'slideshow_mp4'
 
                         else:
@@ -0,0 +1,99 @@
+"""
+Benchmark: sequential vs. concurrent HLS fragment downloads.
+
+Serves a synthetic HLS playlist from a local HTTP server (each segment request
+has artificial latency, like a remote CDN) and downloads it with yt-dlp at
+different `concurrent_fragment_downloads` settings.
+
+Usage:
+    uv run python benchmarks/bench_fragments.py [--segments 60] [--latency 0.05] [--workers 1 2 4 8]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import yt_dlp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.fragments import ThrottleWatchLogger
+
+def make_handler(segments, segment_size, latency):
+    payload = bytes(range(256)) * (segment_size // 256)
+
+    class HLSHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, body, content_type):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith("/stream.m3u8"):
+                lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:2", "#EXT-X-MEDIA-SEQUENCE:0"]
+                for i in range(segments):
+                    lines += ["#EXTINF:2.0,", f"seg{i:05d}.ts"]
+                lines.append("#EXT-X-ENDLIST")
+                self._send(("\n".join(lines) + "\n").encode(), "application/vnd.apple.mpegurl")
+            elif self.path.startswith("/seg"):
+                time.sleep(latency)
+                self._send(payload, "video/mp2t")
+            else:
+                self.send_error(404)
+
+    return HLSHandler
+
+def run_download(url, workers, out_dir):
+    output = os.path.join(out_dir, f"bench_{workers}.ts")
+    ydl_opts = {
+        'outtmpl': output,
+        'quiet': True,
+        'logger': ThrottleWatchLogger(),
+        'concurrent_fragment_downloads': workers,
+        'fixup': 'never',
+        'hls_use_mpegts': True,
+    }
+    start = time.time()
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        ydl.download([url])
+    elapsed = time.time() - start
+    size = os.path.getsize(output) if os.path.exists(output) else 0
+    return elapsed, size
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent HLS fragment downloads")
+    parser.add_argument("--segments", type=int, default=60, help="Number of HLS segments (default: 60)")
+    parser.add_argument("--segment-kb", type=int, default=256, help="Segment size in KB (default: 256)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Per-segment server latency in seconds (default: 0.05)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Fragment concurrency levels to test")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.segments, args.segment_kb * 1024, args.latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/stream.m3u8"
+
+    out_dir = tempfile.mkdtemp(prefix="bench_fragments_")
+    print(f"📊 {args.segments} segments x {args.segment_kb} KB, {args.latency * 1000:.0f} ms latency per segment\n")
+    print(f"{'workers':>8} {'time (s)':>10} {'MB/s':>8} {'speedup':>8}")
+    baseline = None
+    try:
+        for workers in args.workers:
+            elapsed, size = run_download(url, workers, out_dir)
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>10.2f} {size / elapsed / (1024 * 1024):>8.1f} {baseline / elapsed:>7.1f}x")
+    finally:
+        server.shutdown()
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark: per-job latency of the `demucs` CLI subprocess vs. the warm in-process engine.
+
+Generates short test tracks with ffmpeg (a few tones plus noise) and separates each
+one both ways. The CLI pays interpreter start, torch import and model loading on
+every job; the engine pays them once (reported separately as "cold load").
+
+Usage:
+    uv run python benchmarks/bench_separation.py [--jobs 3] [--seconds 10 30]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.separation import SeparationEngine, DEFAULT_MODEL
+
+def make_track(path, seconds):
+    cmd = [
+        "ffmpeg", "-y",
+        "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=660:duration={seconds}",
+        "-f", "lavfi", "-i", f"anoisesrc=amplitude=0.05:duration={seconds}",
+        "-filter_complex", "amix=inputs=3,aformat=channel_layouts=stereo",
+        "-ar", "44100",
+        path
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def run_subprocess(track, out_dir):
+    start = time.time()
+    subprocess.run(
+        ["demucs", "--mp3", "--two-stems=vocals", "-n", DEFAULT_MODEL, "-o", out_dir, track],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return time.time() - start
+
+def run_engine(engine, track, out_dir):
+    start = time.time()
+    engine.separate_to_files(track, out_dir, two_stems="vocals")
+    return time.time() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark demucs CLI vs. warm in-process separation")
+    parser.add_argument("--jobs", type=int, default=3, help="Jobs per track length (default: 3)")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[10, 30], help="Track lengths to test (default: 10 30)")
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg") or not shutil.which("demucs"):
+        print("❌ Error: ffmpeg and the demucs CLI must be installed.")
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="bench_separation_")
+    try:
+        engine = SeparationEngine()
+        start = time.time()
+        engine.load()
+        print(f"📊 Engine cold load ({DEFAULT_MODEL}, {engine.device}): {time.time() - start:.2f}s\n")
+
+        print(f"{'track (s)':>10} {'cli (s/job)':>12} {'engine (s/job)':>15} {'speedup':>8}")
+        for seconds in args.seconds:
+            track = os.path.join(work_dir, f"track_{seconds:g}s.wav")
+            make_track(track, seconds)
+            cli = [run_subprocess(track, os.path.join(work_dir, "cli")) for _ in range(args.jobs)]
+            warm = [run_engine(engine, track, os.path.join(work_dir, "engine")) for _ in range(args.jobs)]
+            cli_avg, warm_avg = sum(cli) / len(cli), sum(warm) / len(warm)
+            print(f"{seconds:>10g} {cli_avg:>12.2f} {warm_avg:>15.2f} {cli_avg / warm_avg:>7.1f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,37 @@
-import yt_dlp
 import sys
+import atexit
 import argparse
 import os
+import multiprocessing
 
 from utils.drive import upload_file_to_drive, DEFAULT_FOLDER_ID
-from utils.media import process_vocal_removal, mute_video, loop_video, clip_video, replace_audio, mix_audio, image_to_video, images_to_video, slideshow
-
-def download_video(url, interactive=True):
+from utils.download import fetch_video_info, download_with_info, safe_filename, build_download_opts, clip_download_section, download_audio_only, download_video_only
+from utils.batch import expand_batch_source, batch_download, expand_media_paths, batch_separate
+from utils.sync import sync_source
+from utils.formats import choose_format
+from utils.progress import json_lines_sink
+from utils.fragments import set_fragment_workers
+from utils.pipeline import stream_mute, stream_loop
+from utils.separation import stem_cache_stats, get_engine, pin_cpu_threads, SEPARATION_PRESETS, DEFAULT_PRESET
+from utils.media import VOCAL_REMOVAL_OUTPUTS, process_vocal_removal, mute_video, loop_video, clip_video, parse_time, replace_audio, mix_audio, image_to_video, images_to_video, slideshow
+
+def download_video(url, interactive=True, clip_start=None, clip_duration=None, progress=None):
+    """
+    Downloads a video, optionally only the part needed for a clip.
+
+    Args:
+        url (str): Video URL.
+        interactive (bool): Ask for the resolution instead of picking the best.
+        clip_start (str, optional): If set, download only this clip (e.g. "20s") and return it.
+        clip_duration (str, optional): Clip duration. If None, clips to the end.
+        progress (func, optional): Callback receiving progress events (see utils.progress).
+
+    Returns:
+        str: Path to the downloaded (or clipped) video, or None on failure.
+    """
     print("\nFetching video information...")
-    ydl_opts_info = {'quiet': True, 'no_warnings': True}
     try:
-        with yt_dlp.YoutubeDL(ydl_opts_info) as ydl:
-            info = ydl.extract_info(url, download=False)
+        info = fetch_video_info(url)
     except Exception as e:
         print(f"Error: {e}"); return None
 
@@ -42,32 +62,78 @@ def download_video(url, interactive=True):
     else:
         print("Auto-selecting best quality (CLI mode)...")
     
-    print(f"\nDownloading...")
-    safe_title = "".join([c for c in title if c.isalpha() or c.isdigit() or c in ' ._-']).rstrip()
-    if not safe_title: safe_title = "video"
-    output_filename = f"{safe_title}.mp4"
-    
-    if target_height:
-        format_str = f'bestvideo[height={target_height}]+bestaudio/best[height={target_height}]'
-    else:
-        format_str = 'bestvideo+bestaudio/best' # Default best
+    output_filename = f"{safe_filename(title)}.mp4"
+    section = None
+    if clip_start is not None:
+        start_seconds = parse_time(clip_start)
+        duration_seconds = parse_time(clip_duration) if clip_duration else None
+        if start_seconds is None or (clip_duration and duration_seconds is None):
+            print(f"❌ Invalid clip time: start={clip_start}, duration={clip_duration}")
+            return None
+        # Fetch only the clip window (plus a keyframe margin) instead of the whole video
+        section, trim_offset = clip_download_section(start_seconds, duration_seconds)
+        clipped_filename = f"{safe_filename(title)}_clipped.mp4"
+        output_filename = f"{safe_filename(title)}_section.mp4"
+        print(f"\n✂️ Downloading only the clip section ({section[0]:.1f}s onwards)...")
+
+    choice = choose_format(info, target_height)
+    print(f"\n🎯 Format: {choice['label']} - {choice['reason']}")
 
-    ydl_opts = {
-        'format': format_str,
-        'merge_output_format': 'mp4',
-        'outtmpl': output_filename,
-        'ignoreerrors': True,
-        'quiet': not interactive, 
-    }
+    print(f"\nDownloading...")
+    # yt-dlp's own console output would interleave with a JSON progress stream
+    quiet = not interactive or progress is not None
+    ydl_opts = build_download_opts(output_filename, quiet=quiet, section=section, format_str=choice['format'], progress=progress)
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl: ydl.download([url])
+        # Reuse the extracted info so the URL is not extracted a second time
+        if not download_with_info(info, ydl_opts):
+            print("\n❌ Error: Download failed.")
+            return None
         print(f"\n✅ Download complete: {output_filename}")
+        if section:
+            clipped = clip_video(output_filename, trim_offset, duration_seconds, clipped_filename)
+            os.remove(output_filename)
+            return clipped
         return output_filename
     except Exception as e:
         print(f"\n❌ Error: {e}")
         return None
 
+def instrumental_from_url(url, make_video=True, progress=None, outputs=None, preset=DEFAULT_PRESET):
+    """
+    Vocal removal straight from a URL: downloads only the audio stream for separation,
+    and fetches the video stream afterwards only if the karaoke MP4 is wanted.
+
+    Args:
+        url (str): Video URL.
+        make_video (bool): Also create the karaoke MP4.
+        progress (func, optional): Callback receiving progress events (see utils.progress).
+        outputs (iterable, optional): Outputs to create (see process_vocal_removal).
+        preset (str): Speed/quality preset (see SEPARATION_PRESETS).
+
+    Returns:
+        dict: Output paths from process_vocal_removal, or None on failure.
+    """
+    print("\nFetching video information...")
+    try:
+        info = fetch_video_info(url)
+    except Exception as e:
+        print(f"Error: {e}"); return None
+
+    base_name = safe_filename(info.get('title'))
+    print(f"\n🎧 Downloading audio only...")
+    try:
+        audio_file = download_audio_only(info, base_name, progress=progress)
+    except Exception as e:
+        print(f"\n❌ Error: {e}"); return None
+    if not audio_file:
+        print("\n❌ Error: Audio download failed.")
+        return None
+
+    video_source = (lambda: download_video_only(info, f"{base_name}_video", progress=progress)) if make_video else None
+    outputs = [o for o in (outputs or VOCAL_REMOVAL_OUTPUTS) if make_video or o != 'mp4']
+    return process_vocal_removal(audio_file, video_source=video_source, engine=get_engine(preset=preset), outputs=outputs)
+
 def interactive_mode():
     print("🎥 Video Downloader (Interactive Mode)")
     url = input("Enter Video Link: ").strip()
@@ -148,9 +214,23 @@ def main():
     parser = argparse.ArgumentParser(description="ytdlr CLI - YouTube Downloader & Processor")
     
     parser.add_argument("--download", metavar="URL", help="Download video from URL (auto-selects best quality)")
-    parser.add_argument("--instrumental", metavar="FILE", help="Remove vocals from an existing video/audio file")
+    parser.add_argument("--batch", metavar="FILE_OR_URL", help="Download many videos: a text file of URLs (one per line) or a playlist/channel URL")
+    parser.add_argument("--workers", metavar="N", type=int, help="Concurrent downloads for --batch (default: 4), or separation processes for several --instrumental files (default: one per 4 cores)")
+    parser.add_argument("--per-host", metavar="N", type=int, help="Concurrent downloads per site for --batch (default: 2)")
+    parser.add_argument("--sync", metavar="URL", help="Mirror a playlist/channel, downloading only new or changed videos (uses a download archive)")
+    parser.add_argument("--fragments", metavar="N", type=int, help="Max parallel fragment downloads for HLS/DASH sources (default: 8, lowered automatically when throttled)")
+    parser.add_argument("--progress-json", metavar="FILE", help="Write download progress events as JSON lines to FILE")
+    parser.add_argument("--output-dir", metavar="DIR", help="Output folder for --batch, --sync and --instrumental (default: current folder)")
+    parser.add_argument("--instrumental", metavar="FILE", nargs="+", help="Remove vocals from existing video/audio files or folders (several files run in parallel worker processes)")
+    parser.add_argument("--instrumental-url", metavar="URL", help="Remove vocals from a URL, downloading only the audio (video is fetched only for the karaoke MP4)")
+    parser.add_argument("--outputs", metavar="OUTPUT", nargs="+", choices=VOCAL_REMOVAL_OUTPUTS, help="With --instrumental/--instrumental-url: only create these (mp3 = backing track, vocals_mp3, mp4 = karaoke video; default: all)")
+    parser.add_argument("--preset", choices=list(SEPARATION_PRESETS), help="Vocal removal speed/quality on CPU: fast (int8, no shifts), balanced (default) or quality (more shifts/overlap)")
+    parser.add_argument("--stem-cache-stats", action="store_true", help="Show hit/miss counts and disk usage of the separated-stems cache")
+    parser.add_argument("--audio-only", action="store_true", help="With --instrumental-url: skip the karaoke MP4 (never downloads video)")
     parser.add_argument("--mute", metavar="FILE", help="Mute (remove audio) from a video file")
+    parser.add_argument("--mute-url", metavar="URL", help="Download a muted video in one pass (streams the video into ffmpeg)")
     parser.add_argument("--loop", metavar="FILE", help="Loop a video file (requires --duration)")
+    parser.add_argument("--loop-url", metavar="URL", help="Download a video once and loop it with stream copies (requires --duration)")
     parser.add_argument("--clip", metavar="FILE", help="Clip a video file (requires --start and --duration)")
     parser.add_argument("--start", metavar="TIME", help="Start time for clip (e.g. '10s')")
     parser.add_argument("--duration", metavar="TIME", help="Target duration for loop or clip (e.g. '1h', '30m')")
@@ -160,33 +240,99 @@ def main():
     parser.add_argument("--slideshow", metavar="IMAGE_FOLDER", help="Create a slideshow from images (shows all images once, requires --audio)")
     parser.add_argument("--images-to-video", metavar="IMAGE_FOLDER", help="Create a video from images (loops to match audio duration, requires --audio)")
     parser.add_argument("--duration-per-image", metavar="SECONDS", type=float, default=3.0, help="Duration for each image in slideshow (default: 3.0s)")
+    parser.add_argument("--render-workers", metavar="N", type=int, help="Slideshow clips rendered in parallel (default: one per core)")
+    parser.add_argument("--single-pass", action="store_true", help="Encode slideshows with one ffmpeg process (no per-clip files, concat or separate audio mux)")
+    parser.add_argument("--crossfade", metavar="SECONDS", type=float, default=0.0, help="Crossfade between slideshow images (implies --single-pass)")
+    parser.add_argument("--seed", metavar="N", type=int, help="Seed for the slideshow effect sequence (default: 0; same seed and images give the same video)")
     parser.add_argument("--audio", metavar="AUDIO_FILE", help="Audio file to use for replacement, mixing, or video generation")
     parser.add_argument("--upload", metavar="FILE", help="Upload a file to Google Drive")
     parser.add_argument("--folder", metavar="ID", help="Google Drive Folder ID (for use with only --upload)")
 
     args = parser.parse_args()
 
+    # Pin torch's CPU threads before anything imports torch. Batch separation instead
+    # gives each worker its own cores, so the parent must stay unpinned.
+    separation_paths = expand_media_paths(args.instrumental) if args.instrumental else []
+    if len(separation_paths) <= 1:
+        pin_cpu_threads()
+
     # If no arguments provided, run legacy interactive mode
     if not any(vars(args).values()):
         interactive_mode()
         return
 
+    if args.fragments:
+        set_fragment_workers(args.fragments)
+
+    # Machine-readable progress stream for downloads
+    progress = None
+    if args.progress_json:
+        # A file of its own: stdout/stderr also carry messages and yt-dlp warnings
+        progress_stream = open(args.progress_json, "a")
+        atexit.register(progress_stream.close)
+        progress = json_lines_sink(progress_stream)
+
     # 1. Download Mode
     if args.download:
-        download_video(args.download, interactive=False)
+        # --start/--duration without --clip FILE: download only the clip section
+        clip_start = args.start if args.start and not args.clip else None
+        clipped = download_video(args.download, interactive=False, clip_start=clip_start, clip_duration=args.duration, progress=progress)
+        if clipped and clip_start: print(f"✅ Created: {clipped}")
         # Note: In pure flag mode, we don't return the filename to 'downloaded_file' for chaining 
         # because the user might just want to download. Chaining in flags is complex.
         # If they want chaining, they should use interactive mode or script it.
 
+    # 1b. Batch Download Mode
+    if args.batch:
+        print(f"🔎 Collecting URLs from {args.batch}...")
+        urls = expand_batch_source(args.batch)
+        if not urls:
+            print(f"❌ Error: No URLs found in '{args.batch}'.")
+            return
+        batch_download(urls, workers=args.workers or 4, per_host=args.per_host or 2, output_dir=args.output_dir, progress=progress)
+
+    # 1c. Sync Mode
+    if args.sync:
+        sync_source(args.sync, args.output_dir or ".", workers=args.workers or 4, per_host=args.per_host or 2, progress=progress)
+
     # 2. Instrumental Mode
+    preset = args.preset or DEFAULT_PRESET
     if args.instrumental:
-        process_vocal_removal(args.instrumental)
+        paths = separation_paths
+        if len(paths) > 1:
+            batch_separate(paths, workers=args.workers, outputs=args.outputs, output_dir=args.output_dir, preset=preset)
+        else:
+            for path in paths:
+                process_vocal_removal(path, engine=get_engine(preset=preset), outputs=args.outputs, output_dir=args.output_dir)
+
+    if args.stem_cache_stats:
+        stats = stem_cache_stats()
+        rate = f"{stats['hit_rate'] * 100:.0f}%" if stats['hit_rate'] is not None else "n/a"
+        print(f"📦 Stem cache: {stats['entries']} entries, {stats['bytes'] / (1024 * 1024):.1f} MB")
+        print(f"   Hits: {stats['hits']}  Misses: {stats['misses']}  Hit rate: {rate}")
+
+    if args.instrumental_url:
+        instrumental_from_url(args.instrumental_url, make_video=not args.audio_only, progress=progress, outputs=args.outputs, preset=preset)
 
     # 3. Mute Mode
     if args.mute:
         muted = mute_video(args.mute)
         if muted: print(f"✅ Created: {muted}")
 
+    if args.mute_url:
+        try:
+            info = fetch_video_info(args.mute_url)
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            info = None
+        if info:
+            muted = stream_mute(info)
+            if not muted:
+                # Not streamable (e.g. DASH fragments): download first, then mute
+                downloaded = download_video(args.mute_url, interactive=False, progress=progress)
+                muted = mute_video(downloaded) if downloaded else None
+            if muted: print(f"✅ Created: {muted}")
+
     # 4. Loop Mode
     if args.loop:
         if not args.duration:
@@ -195,6 +341,18 @@ def main():
         looped = loop_video(args.loop, args.duration)
         if looped: print(f"✅ Created: {looped}")
 
+    if args.loop_url:
+        if not args.duration:
+            print("❌ Error: --loop-url requires --duration (e.g. --duration '1h')")
+            return
+        try:
+            info = fetch_video_info(args.loop_url)
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            info = None
+        looped = stream_loop(info, args.duration) if info else None
+        if looped: print(f"✅ Created: {looped}")
+
     # 5. Clip Mode
     if args.clip:
         if not args.start:
@@ -250,7 +408,8 @@ def main():
             return
 
         print(f"📸 Found {len(image_paths)} images.")
-        slideshow_video = slideshow(image_paths, args.audio, args.duration_per_image)
+        slideshow_video = slideshow(image_paths, args.audio, args.duration_per_image, workers=args.render_workers, seed=args.seed,
+                                    single_pass=args.single_pass, transition=args.crossfade)
         if slideshow_video: print(f"✅ Created: {slideshow_video}")
 
     # 10. Images to Video Mode (loops to match audio duration)
@@ -276,7 +435,8 @@ def main():
             return
 
         print(f"📸 Found {len(image_paths)} images.")
-        slideshow_video = images_to_video(image_paths, args.audio, args.duration_per_image)
+        slideshow_video = images_to_video(image_paths, args.audio, args.duration_per_image, workers=args.render_workers, seed=args.seed,
+                                          single_pass=args.single_pass, transition=args.crossfade)
         if slideshow_video: print(f"✅ Created: {slideshow_video}")
 
     # 3. Upload Mode
@@ -287,4 +447,5 @@ def main():
             print(f"✅ Upload Complete! 🔗 {link}")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Pool workers of frozen (PyInstaller) builds run their job, not main()
     main()
@@ -0,0 +1,335 @@
+import os
+import time
+import random
+import urllib.parse
+import multiprocessing
+import concurrent.futures
+import yt_dlp
+
+from utils.download import download_url, resolve_share_url
+from utils.media import process_vocal_removal, get_video_duration
+from utils.separation import get_engine, default_device, pin_cpu_threads, configure_cpu_threads, DEFAULT_PRESET
+
+# Torch CPU inference scales sub-linearly past a few threads, so many-core machines
+# run more separation processes with fewer threads each
+SEPARATION_THREADS_PER_WORKER = 4
+# File types picked up when a folder is given for batch separation
+MEDIA_EXTENSIONS = ('.mp3', '.wav', '.flac', '.m4a', '.aac', '.ogg', '.opus', '.mp4', '.mkv', '.webm', '.mov')
+
+# Substrings in yt-dlp error messages that mean "slow down", not "this video is broken"
+THROTTLE_MARKERS = ('HTTP Error 429', 'HTTP Error 403', 'Too Many Requests', 'rate-limit', 'rate limit')
+
+def _host_of(url):
+    host = urllib.parse.urlsplit(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+def _is_throttled(error):
+    msg = str(error)
+    return any(marker.lower() in msg.lower() for marker in THROTTLE_MARKERS)
+
+def _is_nested_playlist(entry):
+    # Channel URLs list their tabs (Videos, Shorts, ...) as playlist entries
+    ie_key = entry.get('ie_key') or ''
+    return entry.get('_type') == 'playlist' or ie_key.endswith('Tab') or ie_key.endswith('Playlist')
+
+def flat_entries(ydl, url, depth=0):
+    """
+    Lists the entries of a playlist/channel URL using flat extraction.
+
+    Args:
+        ydl (YoutubeDL): Instance created with {'extract_flat': 'in_playlist'}.
+        url (str): Playlist, channel, or single video URL.
+
+    Returns:
+        list: Dicts with 'url', 'id' and 'ie_key' (id/ie_key may be None).
+              A non-playlist URL yields a single entry for itself.
+    """
+    try:
+        info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        print(f"⚠️ Could not expand {url}: {e}")
+        return [{'url': url, 'id': None, 'ie_key': None}]
+
+    if info.get('_type') not in ('playlist', 'multi_video') or info.get('entries') is None:
+        return [{'url': url, 'id': info.get('id'), 'ie_key': info.get('extractor_key')}]
+
+    entries = []
+    for entry in info['entries']:
+        if not entry:
+            continue
+        entry_url = entry.get('webpage_url') or entry.get('url')
+        if not entry_url:
+            continue
+        if depth < 2 and _is_nested_playlist(entry):
+            entries.extend(flat_entries(ydl, entry_url, depth + 1))
+        else:
+            entries.append({'url': entry_url, 'id': entry.get('id'), 'ie_key': entry.get('ie_key')})
+    return entries
+
+def expand_batch_source(source):
+    """
+    Turns a batch source into a list of video URLs.
+
+    Args:
+        source (str): Path to a text file with one URL per line ('#' comments allowed),
+                      or a playlist/channel URL.
+
+    Returns:
+        list: Video URLs, in order, without duplicates.
+    """
+    if os.path.isfile(source):
+        with open(source, "r") as f:
+            candidates = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+    else:
+        candidates = [source]
+
+    urls = []
+    # Flat extraction lists playlist/channel entries without extracting each video
+    ydl_opts = {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist'}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        for candidate in candidates:
+            urls.extend(e['url'] for e in flat_entries(ydl, resolve_share_url(candidate)))
+
+    return list(dict.fromkeys(urls))
+
+def batch_download(urls, workers=4, per_host=2, max_retries=4, backoff_base=5.0, target_height=None, output_dir=None, job=None, progress=None):
+    """
+    Downloads many URLs through a bounded worker pool.
+
+    At most `per_host` downloads run against the same host at once. When a host
+    answers 429/403 the job is requeued with exponential backoff and the whole
+    host is paused, so other hosts keep the pool busy in the meantime.
+
+    Args:
+        urls (list): Video URLs.
+        workers (int): Maximum concurrent downloads overall.
+        per_host (int): Maximum concurrent downloads per host.
+        max_retries (int): Retries per URL after throttling responses.
+        backoff_base (float): First backoff delay in seconds (doubles every retry).
+        target_height (int, optional): Preferred video height. None = best quality.
+        output_dir (str, optional): Directory for downloaded files.
+        job (func, optional): Worker function(url) -> path. Defaults to download_url
+                              with the options above.
+        progress (func, optional): Callback receiving progress events from every
+                                   download (see utils.progress).
+
+    Returns:
+        dict: Summary with 'completed' {url: path}, 'failed' {url: error},
+              'retries' (int) and 'elapsed' (float, seconds).
+    """
+    if job is None:
+        def job(url):
+            return download_url(url, target_height=target_height, output_dir=output_dir, quiet=True, progress=progress)
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Pending entries are (url, attempt, not_before)
+    pending = [(url, 0, 0.0) for url in urls]
+    active_per_host = {}
+    host_paused_until = {}
+    completed = {}
+    failed = {}
+    retries = 0
+    start = time.time()
+
+    print(f"📥 Batch download: {len(urls)} URLs, {workers} workers, {per_host} per host")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        while pending or running:
+            now = time.time()
+
+            # Start every pending job whose host has a free slot and is not cooling down
+            still_pending = []
+            for url, attempt, not_before in pending:
+                host = _host_of(url)
+                can_start = (
+                    len(running) < workers
+                    and active_per_host.get(host, 0) < per_host
+                    and now >= not_before
+                    and now >= host_paused_until.get(host, 0.0)
+                )
+                if can_start:
+                    active_per_host[host] = active_per_host.get(host, 0) + 1
+                    running[pool.submit(job, url)] = (url, attempt)
+                else:
+                    still_pending.append((url, attempt, not_before))
+            pending = still_pending
+
+            if not running:
+                # Everything left is backing off; sleep until the earliest one may start
+                wake_at = min(max(nb, host_paused_until.get(_host_of(u), 0.0)) for u, _, nb in pending)
+                time.sleep(max(0.1, wake_at - time.time()))
+                continue
+
+            done, _ = concurrent.futures.wait(running, timeout=1.0, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                url, attempt = running.pop(future)
+                host = _host_of(url)
+                active_per_host[host] -= 1
+                try:
+                    completed[url] = future.result()
+                    print(f"  ✓ [{len(completed) + len(failed)}/{len(urls)}] {completed[url]}")
+                except Exception as e:
+                    if _is_throttled(e) and attempt < max_retries:
+                        delay = backoff_base * (2 ** attempt) + random.uniform(0, backoff_base)
+                        retry_at = time.time() + delay
+                        host_paused_until[host] = max(host_paused_until.get(host, 0.0), retry_at)
+                        pending.append((url, attempt + 1, retry_at))
+                        retries += 1
+                        print(f"  ⏳ {host} throttled, retrying {url} in {delay:.0f}s (attempt {attempt + 1}/{max_retries})")
+                    else:
+                        failed[url] = str(e)
+                        print(f"  ✗ [{len(completed) + len(failed)}/{len(urls)}] {url}: {e}")
+
+    elapsed = time.time() - start
+    summary = {'completed': completed, 'failed': failed, 'retries': retries, 'elapsed': elapsed}
+    print_batch_summary(summary)
+    return summary
+
+def print_batch_summary(summary):
+    """Prints a short end-of-run report for batch_download()."""
+    completed, failed = summary['completed'], summary['failed']
+    total_bytes = sum(os.path.getsize(p) for p in completed.values() if p and os.path.exists(p))
+    elapsed = summary['elapsed']
+    rate = total_bytes / elapsed / (1024 * 1024) if elapsed > 0 else 0
+
+    print("\n📊 Batch summary")
+    print(f"  ✅ Completed: {len(completed)}")
+    print(f"  ❌ Failed:    {len(failed)}")
+    print(f"  🔁 Retries:   {summary['retries']}")
+    print(f"  💾 Data:      {total_bytes / (1024 * 1024):.1f} MB in {elapsed:.1f}s ({rate:.2f} MB/s)")
+    for url, error in failed.items():
+        print(f"     - {url}: {error}")
+
+def expand_media_paths(paths):
+    """Expands folders in `paths` to the audio/video files directly inside them (sorted)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(MEDIA_EXTENSIONS) and os.path.isfile(os.path.join(path, name))
+            )
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+def plan_separation_workers(jobs, workers=None, cpu_count=None):
+    """
+    Splits the CPU cores between separation processes.
+
+    Returns:
+        tuple: (worker processes, torch threads per worker)
+    """
+    cpus = cpu_count or os.cpu_count() or 1
+    if not workers:
+        workers = max(1, cpus // SEPARATION_THREADS_PER_WORKER)
+    workers = max(1, min(workers, jobs))
+    return workers, max(1, cpus // workers)
+
+def plan_core_sets(workers, threads):
+    """
+    Splits the CPUs this process may run on into `workers` disjoint sets of `threads`
+    cores, so pinned worker threads never share a core. Returns None where CPU
+    affinity is not supported.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    cpus = sorted(os.sched_getaffinity(0))
+    return [cpus[i * threads:(i + 1) * threads] or cpus for i in range(workers)]
+
+def _init_separation_worker(threads, preset, core_sets):
+    if core_sets is not None:
+        os.sched_setaffinity(0, core_sets.get())
+    pin_cpu_threads(threads)  # Only takes effect in spawned workers, where torch is not loaded yet
+    configure_cpu_threads(threads)
+    get_engine(preset=preset).load()  # Already loaded when inherited from the parent
+
+def _separate_one(path, outputs, output_dir, preset):
+    name = os.path.basename(path)
+    start = time.time()
+    duration = get_video_duration(path) or 0.0
+    result = process_vocal_removal(
+        path,
+        progress_callback=lambda msg: print(f"[{name}] {msg}", flush=True),
+        engine=get_engine(preset=preset),
+        outputs=outputs,
+        output_dir=output_dir
+    )
+    return result, duration, time.time() - start
+
+def batch_separate(paths, workers=None, outputs=None, output_dir=None, preset=DEFAULT_PRESET):
+    """
+    Removes vocals from many files in parallel worker processes.
+
+    Each worker gets its own, disjoint share of the cores for its torch threads. On CPU, where processes
+    can be forked, the model is loaded once up front and shared copy-on-write by all
+    workers; otherwise (GPU, or no fork) workers are spawned and each loads it once for
+    all of its jobs.
+
+    Args:
+        paths (list): Input files.
+        workers (int, optional): Worker processes. Default: one per SEPARATION_THREADS_PER_WORKER cores.
+        outputs (iterable, optional): Outputs per file (see process_vocal_removal).
+        output_dir (str, optional): Output folder. Defaults to the current folder.
+        preset (str): Speed/quality preset (see SEPARATION_PRESETS).
+
+    Returns:
+        dict: Summary with 'completed' (path -> outputs), 'failed' (path -> error),
+              'audio_seconds' and 'elapsed'.
+    """
+    workers, threads = plan_separation_workers(len(paths), workers)
+    print(f"🎛️ Separating {len(paths)} files with {workers} worker(s) x {threads} thread(s)...")
+
+    # A CUDA context cannot cross a fork, so GPU workers are spawned and load the model themselves
+    context = multiprocessing.get_context("spawn")
+    if "fork" in multiprocessing.get_all_start_methods() and default_device() == "cpu":
+        context = multiprocessing.get_context("fork")
+        get_engine(preset=preset).load()
+
+    # Each worker takes its own cores from the queue as it starts
+    core_sets = None
+    planned_sets = plan_core_sets(workers, threads)
+    if planned_sets:
+        core_sets = context.Queue()
+        for cores in planned_sets:
+            core_sets.put(cores)
+
+    completed, failed = {}, {}
+    audio_seconds = 0.0
+    start = time.time()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                initializer=_init_separation_worker, initargs=(threads, preset, core_sets)) as pool:
+        futures = {pool.submit(_separate_one, path, outputs, output_dir, preset): path for path in paths}
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                result, duration, elapsed = future.result()
+            except Exception as e:
+                failed[path] = str(e)
+                print(f"❌ {os.path.basename(path)}: {e}")
+                continue
+            if result:
+                completed[path] = result
+                audio_seconds += duration
+                print(f"✅ {os.path.basename(path)}: {duration:.0f}s of audio in {elapsed:.0f}s")
+            else:
+                failed[path] = "Vocal removal failed"
+
+    summary = {'completed': completed, 'failed': failed, 'audio_seconds': audio_seconds, 'elapsed': time.time() - start}
+    print_separation_summary(summary)
+    return summary
+
+def print_separation_summary(summary):
+    """Prints a short end-of-run report for batch_separate()."""
+    elapsed = summary['elapsed']
+    rate = summary['audio_seconds'] / elapsed if elapsed > 0 else 0
+
+    print("\n📊 Separation summary")
+    print(f"  ✅ Completed:  {len(summary['completed'])}")
+    print(f"  ❌ Failed:     {len(summary['failed'])}")
+    print(f"  ⏱️ Throughput: {summary['audio_seconds']:.0f}s of audio in {elapsed:.1f}s ({rate:.2f} audio-s per wall-s)")
+    for path, error in summary['failed'].items():
+        print(f"     - {path}: {error}")
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import contextlib
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.environ.get("YTDLR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ytdlr"))
+
+class DiskCache:
+    """
+    A small on-disk key/value cache with TTL expiry and LRU eviction.
+
+    Values are JSON-serialisable objects stored one file per entry; whole files can
+    be stored too (put_files/get_files). A single index file tracks creation/access
+    times and sizes so the least recently used entries can be evicted once
+    `max_entries` or `max_bytes` is exceeded; an entry larger than `max_bytes` on its
+    own is not stored at all. Hits and misses are counted in
+    stats.json (see stats()). Every index/stats transaction holds a file lock as well
+    as a thread lock, so several processes can share one cache directory.
+    """
+    def __init__(self, root, ttl=None, max_entries=None, max_bytes=None):
+        """
+        Args:
+            root (str): Directory holding the cache files.
+            ttl (float, optional): Seconds an entry stays valid. None = forever.
+            max_entries (int, optional): Maximum number of entries kept on disk.
+            max_bytes (int, optional): Maximum total size of the entries on disk.
+        """
+        self.root = root
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, "index.json")
+        self.stats_path = os.path.join(root, "stats.json")
+        self.lock_path = os.path.join(root, ".lock")
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # flock is per open file, so threads still need the in-process lock
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _entry_path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, f"{digest}.json")
+
+    def _files_dir(self, key):
+        return os.path.splitext(self._entry_path(key))[0]
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        # Write to a temp file first so a crash never leaves a truncated index
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _drop(self, index, key):
+        index.pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+        shutil.rmtree(self._files_dir(key), ignore_errors=True)
+
+    def _count(self, hit):
+        try:
+            with open(self.stats_path, "r") as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {"hits": 0, "misses": 0}
+        stats["hits" if hit else "misses"] += 1
+        tmp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, self.stats_path)
+
+    def _evict(self, index, now, keep=None):
+        # Expired entries go first, then oldest access time until we fit; `keep` (the
+        # entry just written) is never evicted
+        for k in [k for k, m in index.items() if self._expired(m, now)]:
+            self._drop(index, k)
+        by_access = sorted((k for k in index if k != keep), key=lambda k: index[k].get("accessed", 0))
+        if self.max_entries is not None and len(index) > self.max_entries:
+            for k in by_access[:len(index) - self.max_entries]:
+                self._drop(index, k)
+        if self.max_bytes is not None:
+            total = sum(m.get("size", 0) for m in index.values())
+            for k in by_access:
+                if total <= self.max_bytes:
+                    break
+                if k in index:
+                    total -= index[k].get("size", 0)
+                    self._drop(index, k)
+
+    def _expired(self, meta, now):
+        return self.ttl is not None and now - meta.get("created", 0) > self.ttl
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None if missing or expired."""
+        with self._locked():
+            index = self._load_index()
+            value = self._read(index, key)
+            self._count(value is not None)
+            return value
+
+    def _read(self, index, key):
+        meta = index.get(key)
+        if meta is None:
+            return None
+
+        now = time.time()
+        if self._expired(meta, now):
+            self._drop(index, key)
+            self._save_index(index)
+            return None
+
+        try:
+            with open(self._entry_path(key), "r") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self._drop(index, key)
+            self._save_index(index)
+            return None
+
+        meta["accessed"] = now
+        self._save_index(index)
+        return value
+
+    def set(self, key, value):
+        """
+        Stores `value` under `key`, evicting the least recently used entries if needed.
+        A value larger than `max_bytes` is not cached (any older entry is left as is).
+        """
+        with self._locked():
+            index = self._load_index()
+            self._write(index, key, value)
+            self._save_index(index)
+
+    def _too_big(self, size):
+        return self.max_bytes is not None and size > self.max_bytes
+
+    def _write(self, index, key, value, extra_size=0):
+        data = json.dumps(value)
+        size = len(data.encode("utf-8")) + extra_size
+        if self._too_big(size):
+            return False
+        entry_path = self._entry_path(key)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, entry_path)
+
+        now = time.time()
+        index[key] = {"created": now, "accessed": now, "size": size}
+        self._evict(index, now, keep=key)
+        return True
+
+    def put_files(self, key, files):
+        """
+        Copies files into the cache under `key`.
+
+        Args:
+            key (str): Cache key.
+            files (dict): Name -> path of the files to store. Skipped (any older entry
+                          is left as is) if they are larger than `max_bytes` together.
+        """
+        if self._too_big(sum(os.path.getsize(path) for path in files.values())):
+            return
+        with self._locked():
+            index = self._load_index()
+            files_dir = self._files_dir(key)
+            tmp_dir = f"{files_dir}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            manifest, size = {}, 0
+            # Copy before dropping the old entry: `files` may point into it
+            for name, path in files.items():
+                filename = f"{name}{os.path.splitext(path)[1]}"
+                shutil.copy2(path, os.path.join(tmp_dir, filename))
+                manifest[name] = filename
+                size += os.path.getsize(path)
+            if key in index:
+                self._drop(index, key)
+            os.replace(tmp_dir, files_dir)
+            if not self._write(index, key, {"files": manifest}, extra_size=size):
+                shutil.rmtree(files_dir, ignore_errors=True)
+            self._save_index(index)
+
+    def get_files(self, key):
+        """Returns name -> path of the files stored under `key`, or None if missing, expired or incomplete."""
+        with self._locked():
+            index = self._load_index()
+            value = self._read(index, key)
+            files = None
+            if value is not None:
+                files_dir = self._files_dir(key)
+                files = {name: os.path.join(files_dir, filename) for name, filename in value.get("files", {}).items()}
+                if not all(os.path.exists(p) for p in files.values()):
+                    self._drop(index, key)
+                    self._save_index(index)
+                    files = None
+            self._count(files is not None)
+            return files
+
+    def stats(self):
+        """Returns {'hits', 'misses', 'hit_rate', 'entries', 'bytes'} for sizing the cache."""
+        with self._locked():
+            index = self._load_index()
+            try:
+                with open(self.stats_path, "r") as f:
+                    stats = json.load(f)
+            except (OSError, ValueError):
+                stats = {"hits": 0, "misses": 0}
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else None
+            stats["entries"] = len(index)
+            stats["bytes"] = sum(m.get("size", 0) for m in index.values())
+            return stats
+
+    def delete(self, key):
+        """Removes `key` from the cache if present."""
+        with self._locked():
+            index = self._load_index()
+            if key in index:
+                self._drop(index, key)
+                self._save_index(index)
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._locked():
+            index = self._load_index()
+            for k in list(index):
+                self._drop(index, k)
+            self._save_index(index)
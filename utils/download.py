@@ -0,0 +1,347 @@
+import os
+import urllib.parse
+import urllib.request
+import yt_dlp
+from yt_dlp.extractor import gen_extractor_classes
+
+from utils.cache import DiskCache, DEFAULT_CACHE_DIR
+from utils.formats import build_format_string, choose_format
+from utils.resume import DownloadState
+from utils.progress import ProgressReporter
+from utils.fragments import get_fragment_limiter, ThrottleWatchLogger
+
+# Info dicts carry signed stream URLs that expire (YouTube: ~6h), so keep the TTL well below that
+INFO_CACHE_TTL = 60 * 60
+INFO_CACHE_MAX_ENTRIES = 500
+# Extra seconds fetched around a clip so the section starts on a keyframe before the cut
+CLIP_KEYFRAME_MARGIN = 5.0
+# Share-link redirects practically never change
+REDIRECT_CACHE_TTL = 7 * 24 * 60 * 60
+
+SHARE_LINK_HOSTS = ('xhslink.com',)
+TRACKING_PARAMS = ('si', 'feature', 'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'share_id', 'xsec_source', 'app_platform', 'app_version')
+
+_info_cache = None
+_redirect_cache = None
+_extractor_classes = None
+
+def get_info_cache():
+    """Returns the process-wide cache of extracted info dicts."""
+    global _info_cache
+    if _info_cache is None:
+        _info_cache = DiskCache(os.path.join(DEFAULT_CACHE_DIR, "info"), ttl=INFO_CACHE_TTL, max_entries=INFO_CACHE_MAX_ENTRIES)
+    return _info_cache
+
+def get_redirect_cache():
+    """Returns the process-wide cache of resolved share-link redirects."""
+    global _redirect_cache
+    if _redirect_cache is None:
+        _redirect_cache = DiskCache(os.path.join(DEFAULT_CACHE_DIR, "redirects"), ttl=REDIRECT_CACHE_TTL, max_entries=INFO_CACHE_MAX_ENTRIES)
+    return _redirect_cache
+
+def safe_filename(title, default="video"):
+    """Strips characters that are unsafe in filenames, keeping letters, digits and ' ._-'."""
+    safe_title = "".join([c for c in (title or "") if c.isalpha() or c.isdigit() or c in ' ._-']).rstrip()
+    return safe_title or default
+
+def clip_download_section(start_seconds, duration_seconds=None, margin=CLIP_KEYFRAME_MARGIN):
+    """
+    Computes the section to download for a clip, padded by a keyframe margin.
+
+    Args:
+        start_seconds (float): Clip start in the source video.
+        duration_seconds (float, optional): Clip length. None = until the end.
+        margin (float): Seconds of padding on each side.
+
+    Returns:
+        tuple: ((section_start, section_end), trim_offset) where trim_offset is the
+               clip start relative to the beginning of the downloaded section.
+    """
+    section_start = max(0.0, start_seconds - margin)
+    section_end = start_seconds + duration_seconds + margin if duration_seconds else float('inf')
+    return (section_start, section_end), start_seconds - section_start
+
+def build_download_opts(output_filename, target_height=None, quiet=True, ignoreerrors=True, section=None, format_str=None, progress=None):
+    """
+    Builds the yt-dlp options used for every video download.
+
+    Args:
+        output_filename (str): Fixed output path (merged to MP4).
+        target_height (int, optional): Preferred video height. None = best quality.
+        quiet (bool): Suppress yt-dlp console output.
+        ignoreerrors (bool): If False, download errors are raised instead of just reported.
+        section (tuple, optional): (start, end) seconds to download instead of the whole video.
+        format_str (str, optional): Explicit format (e.g. from choose_format). Overrides target_height.
+        progress (func, optional): Callback receiving progress events (see utils.progress).
+
+    Returns:
+        dict: yt-dlp options.
+    """
+    ydl_opts = {
+        'format': format_str or build_format_string(target_height),
+        'merge_output_format': 'mp4',
+        'outtmpl': output_filename,
+        'ignoreerrors': ignoreerrors,
+        'quiet': quiet,
+    }
+    if section:
+        # Stream-copied section download; the exact cut is made later by clip_video
+        ydl_opts['download_ranges'] = yt_dlp.utils.download_range_func(None, [section])
+        ydl_opts['force_keyframes_at_cuts'] = False
+    if progress:
+        ydl_opts = ProgressReporter(progress).attach(ydl_opts)
+    return ydl_opts
+
+def normalize_url(url):
+    """
+    Normalizes a URL so that trivially different links share one cache entry.
+    Lowercases the host, drops the fragment and tracking parameters, and sorts the query.
+    """
+    parts = urllib.parse.urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urllib.parse.urlunsplit((parts.scheme.lower() or "https", host, path, urllib.parse.urlencode(query), ""))
+
+def _video_key(url):
+    """
+    Returns a cache key based on the extractor and video id if yt-dlp can derive
+    the id from the URL alone (e.g. youtu.be/ID and youtube.com/watch?v=ID match).
+    """
+    global _extractor_classes
+    if _extractor_classes is None:
+        _extractor_classes = [ie for ie in gen_extractor_classes() if ie.ie_key() != 'Generic']
+    for ie in _extractor_classes:
+        try:
+            if ie.suitable(url):
+                video_id = ie.get_temp_id(url)
+                return f"id:{ie.ie_key()}:{video_id}" if video_id else None
+        except Exception:
+            continue
+    return None
+
+def resolve_share_url(url):
+    """
+    Follows share-link redirects (e.g. xhslink.com) to the canonical page URL.
+    Resolutions are cached so repeated requests skip the round-trip.
+    """
+    host = urllib.parse.urlsplit(url).netloc.lower()
+    if not any(host == h or host.endswith("." + h) for h in SHARE_LINK_HOSTS):
+        return url
+
+    cache = get_redirect_cache()
+    key = normalize_url(url)
+    cached = cache.get(key)
+    if cached:
+        return cached['url']
+
+    try:
+        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+        with urllib.request.urlopen(req, timeout=15) as resp:
+            resolved = resp.geturl()
+    except Exception as e:
+        print(f"⚠️ Could not resolve share link {url}: {e}")
+        return url
+
+    cache.set(key, {'url': resolved})
+    return resolved
+
+def fetch_video_info(url, use_cache=True):
+    """
+    Extracts video metadata with yt-dlp, using the on-disk info cache.
+
+    Args:
+        url (str): Video URL.
+        use_cache (bool): If False, always re-extract (the result is still cached).
+
+    Returns:
+        dict: The sanitized yt-dlp info dict. Raises on extraction errors.
+    """
+    url = resolve_share_url(url)
+    cache = get_info_cache()
+    url_key = f"url:{normalize_url(url)}"
+    video_key = _video_key(url)
+
+    if use_cache:
+        for key in (video_key, url_key):
+            if not key:
+                continue
+            entry = cache.get(key)
+            if entry and 'ref' in entry:
+                entry = cache.get(entry['ref'])
+            if entry:
+                return entry
+
+    ydl_opts = {'quiet': True, 'no_warnings': True}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+    # Store the info once under its id, and point URL aliases at it
+    if info.get('id') and info.get('extractor_key'):
+        primary_key = f"id:{info['extractor_key']}:{info['id']}"
+    else:
+        primary_key = video_key or url_key
+    cache.set(primary_key, info)
+    for key in (video_key, url_key):
+        if key and key != primary_key:
+            cache.set(key, {'ref': primary_key})
+    return info
+
+def invalidate_video_info(info):
+    """Drops a cached info dict (e.g. after its stream URLs have expired)."""
+    if info.get('id') and info.get('extractor_key'):
+        get_info_cache().delete(f"id:{info['extractor_key']}:{info['id']}")
+
+def _expected_size(info, format_str):
+    selected = select_format(info, format_str) or {}
+    streams = selected.get('requested_formats') or [selected]
+    sizes = [f.get('filesize') or f.get('filesize_approx') for f in streams]
+    return sum(sizes) if sizes and all(sizes) else None
+
+def download_with_info(info, ydl_opts, resume=True):
+    """
+    Downloads using a previously extracted info dict instead of re-extracting the URL.
+    Falls back to a fresh extraction if the cached stream URLs no longer work.
+
+    With `resume`, the download is tracked in the state store: a verified earlier
+    result is reused as-is, an interrupted one continues from its partial files,
+    and anything unverifiable is deleted and downloaded again.
+
+    Args:
+        info (dict): Info dict from fetch_video_info().
+        ydl_opts (dict): yt-dlp options ('outtmpl' should be a fixed filename).
+        resume (bool): Use the download state store (see utils.resume).
+
+    Returns:
+        str: Path to the downloaded file, or None if it was not created.
+    """
+    output_filename = ydl_opts.get('outtmpl')
+    state = None
+    if resume and output_filename:
+        url = info.get('webpage_url') or info.get('original_url')
+        expected_size = None if ydl_opts.get('download_ranges') else _expected_size(info, ydl_opts.get('format'))
+        state = DownloadState(url, ydl_opts.get('format'), output_filename, expected_size)
+        status = state.check()
+        if status == 'complete':
+            print(f"♻️ Reusing verified download: {output_filename}")
+            return output_filename
+        if status == 'resume':
+            print(f"⏯️ Resuming interrupted download: {output_filename}")
+        ydl_opts = dict(ydl_opts, continuedl=True, progress_hooks=list(ydl_opts.get('progress_hooks', [])) + [state.progress_hook])
+
+    # Fetch HLS/DASH fragments in parallel; the width adapts per site to throttling.
+    # Throttling is only observed for quiet downloads (the logger replaces console output).
+    site = info.get('extractor_key') or 'generic'
+    limiter = get_fragment_limiter()
+    watch = None
+    if 'concurrent_fragment_downloads' not in ydl_opts:
+        ydl_opts = dict(ydl_opts, concurrent_fragment_downloads=limiter.current(site))
+        if ydl_opts.get('quiet') and 'logger' not in ydl_opts:
+            watch = ThrottleWatchLogger()
+            ydl_opts['logger'] = watch
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        try:
+            ydl.process_ie_result(dict(info), download=True)
+        except yt_dlp.utils.DownloadError as e:
+            print(f"⚠️ Cached info failed ({e}), re-extracting...")
+
+        if output_filename and not os.path.exists(output_filename):
+            invalidate_video_info(info)
+            webpage_url = info.get('webpage_url') or info.get('original_url')
+            if webpage_url:
+                ydl.download([webpage_url])
+
+    if watch:
+        if watch.throttled:
+            limiter.record_throttle(site)
+        else:
+            limiter.record_success(site)
+
+    if output_filename and os.path.exists(output_filename):
+        if state:
+            state.mark_complete()
+        return output_filename
+    return None
+
+def select_format(info, format_str):
+    """Returns the info dict yt-dlp would produce for `format_str`, without downloading."""
+    with yt_dlp.YoutubeDL({'format': format_str, 'quiet': True, 'no_warnings': True}) as ydl:
+        return ydl.process_ie_result(dict(info), download=False)
+
+def download_format(info, format_str, output_base, quiet=True, progress=None):
+    """
+    Downloads a single stream (e.g. 'bestaudio' or 'bestvideo') without merging.
+
+    Args:
+        info (dict): Info dict from fetch_video_info().
+        format_str (str): yt-dlp format selector for one stream.
+        output_base (str): Output path without extension (the stream's own extension is added).
+        quiet (bool): Suppress yt-dlp console output.
+        progress (func, optional): Callback receiving progress events (see utils.progress).
+
+    Returns:
+        str: Path to the downloaded file, or None on failure.
+    """
+    selected = select_format(info, format_str)
+    ext = (selected or {}).get('ext') or 'mp4'
+    output_filename = f"{output_base}.{ext}"
+    ydl_opts = {
+        'format': format_str,
+        'outtmpl': output_filename,
+        'ignoreerrors': False,
+        'quiet': quiet,
+    }
+    if progress:
+        ydl_opts = ProgressReporter(progress).attach(ydl_opts)
+    return download_with_info(info, ydl_opts)
+
+def download_audio_only(info, output_base, quiet=True, progress=None):
+    """Downloads only the best audio stream (for separation jobs). Returns the path or None."""
+    return download_format(info, 'bestaudio/best', output_base, quiet=quiet, progress=progress)
+
+def download_video_only(info, output_base, target_height=None, quiet=True, progress=None):
+    """Downloads only the video stream (no audio), e.g. for a karaoke mux. Returns the path or None."""
+    if target_height:
+        format_str = f'bestvideo[height={target_height}]/bestvideo/best[height={target_height}]'
+    else:
+        format_str = 'bestvideo/best'
+    # Prefer a stream that can be copied straight into the karaoke MP4
+    choice = choose_format(info, target_height)
+    if choice['video']:
+        format_str = f"{choice['video']['format_id']}/{format_str}"
+    return download_format(info, format_str, output_base, quiet=quiet, progress=progress)
+
+def download_url(url, target_height=None, output_dir=None, quiet=True, progress=None):
+    """
+    Non-interactive download of a single URL with the standard format selection.
+    Errors are raised (not swallowed) so callers can retry or report them.
+
+    Args:
+        url (str): Video URL.
+        target_height (int, optional): Preferred video height. None = best quality.
+        output_dir (str, optional): Directory for the output file. Defaults to CWD.
+        quiet (bool): Suppress yt-dlp console output.
+        progress (func, optional): Callback receiving progress events (see utils.progress).
+
+    Returns:
+        str: Path to the downloaded MP4, named "<title> [<id>].mp4".
+    """
+    info = fetch_video_info(url)
+    # The id keeps same-titled videos (downloaded concurrently in a batch) apart, as in sync
+    title = safe_filename(info.get('title'))
+    output_filename = f"{title} [{info['id']}].mp4" if info.get('id') else f"{title}.mp4"
+    if output_dir:
+        output_filename = os.path.join(output_dir, output_filename)
+
+    choice = choose_format(info, target_height)
+    ydl_opts = build_download_opts(output_filename, quiet=quiet, ignoreerrors=False, format_str=choice['format'], progress=progress)
+    result = download_with_info(info, ydl_opts)
+    if not result:
+        raise yt_dlp.utils.DownloadError(f"Output file was not created for {url}")
+    return result
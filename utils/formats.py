@@ -0,0 +1,136 @@
+# How well each codec family can be stream-copied into the container and through our
+# ffmpeg steps (karaoke mux, replace/mix audio, loop, concat all use -c:v copy into MP4).
+VIDEO_CODEC_SCORES = {
+    'mp4': {'h264': 3, 'h265': 2, 'av1': 1},
+    'webm': {'vp9': 3, 'av1': 3, 'vp8': 2},
+}
+AUDIO_CODEC_SCORES = {
+    'mp4': {'aac': 3, 'mp3': 2, 'ac3': 1},
+    'webm': {'opus': 3, 'vorbis': 2},
+}
+# Score for formats whose codec the extractor does not report
+UNKNOWN_CODEC_SCORE = 1
+
+CODEC_FAMILIES = {
+    'avc1': 'h264', 'avc3': 'h264', 'h264': 'h264',
+    'hev1': 'h265', 'hvc1': 'h265', 'hevc': 'h265', 'h265': 'h265',
+    'av01': 'av1', 'av1': 'av1',
+    'vp09': 'vp9', 'vp9': 'vp9', 'vp8': 'vp8',
+    'mp4a': 'aac', 'aac': 'aac', 'mp3': 'mp3',
+    'opus': 'opus', 'vorbis': 'vorbis',
+    'ac-3': 'ac3', 'ec-3': 'ac3',
+}
+
+def build_format_string(target_height=None):
+    """Returns the yt-dlp format selector for the requested height (None = best available)."""
+    if target_height:
+        return f'bestvideo[height={target_height}]+bestaudio/best[height={target_height}]'
+    return 'bestvideo+bestaudio/best'
+
+def codec_family(codec):
+    """Maps a codec string such as 'avc1.640028' or 'mp4a.40.2' to its family ('h264', 'aac', ...)."""
+    if not codec or codec == 'none':
+        return None
+    return CODEC_FAMILIES.get(codec.lower().split('.')[0], codec.lower().split('.')[0])
+
+def _has_video(f):
+    return f.get('vcodec') != 'none' and (f.get('height') or f.get('vcodec'))
+
+def _has_audio(f):
+    return f.get('acodec') != 'none' and (f.get('acodec') or f.get('abr'))
+
+def _codec_score(codec, table):
+    family = codec_family(codec)
+    if family is None:
+        return UNKNOWN_CODEC_SCORE
+    return table.get(family, 0)
+
+def _size(f):
+    return f.get('filesize') or f.get('filesize_approx') or 0
+
+def _video_key(f, container):
+    return (_codec_score(f.get('vcodec'), VIDEO_CODEC_SCORES[container]), f.get('vbr') or f.get('tbr') or 0, _size(f))
+
+def _audio_key(f, container):
+    return (_codec_score(f.get('acodec'), AUDIO_CODEC_SCORES[container]), f.get('abr') or f.get('tbr') or 0, _size(f))
+
+def _describe(f, kind):
+    codec = f.get('vcodec') if kind == 'video' else f.get('acodec')
+    family = codec_family(codec) or 'unknown'
+    rate = f.get('vbr') if kind == 'video' else f.get('abr')
+    if not rate and 'none' in (f.get('vcodec'), f.get('acodec')):
+        rate = f.get('tbr')  # tbr is only per-stream for single-stream formats
+    return f"{family}" + (f" {rate:.0f}k" if rate else "")
+
+def rank_formats(formats, kind, container='mp4'):
+    """
+    Sorts formats of one kind ('video' = video-only, 'audio' = audio-only) best first:
+    codec compatibility with `container`, then bitrate, then filesize.
+    """
+    if kind == 'video':
+        candidates = [f for f in formats if _has_video(f) and f.get('acodec') == 'none']
+        return sorted(candidates, key=lambda f: _video_key(f, container), reverse=True)
+    candidates = [f for f in formats if _has_audio(f) and f.get('vcodec') == 'none']
+    return sorted(candidates, key=lambda f: _audio_key(f, container), reverse=True)
+
+def choose_format(info, target_height=None, container='mp4'):
+    """
+    Picks the video/audio formats that can be merged into `container` (and later
+    processed) with pure stream copies, preferring quality within that.
+
+    Args:
+        info (dict): yt-dlp info dict.
+        target_height (int, optional): Requested height. None = highest available.
+        container (str): Output container ('mp4' or 'webm').
+
+    Returns:
+        dict: {'format': yt-dlp format string, 'video': fmt or None, 'audio': fmt or None,
+               'label': short description, 'reason': why it was picked}.
+    """
+    fallback = build_format_string(target_height)
+    formats = [f for f in (info.get('formats') or []) if f.get('format_id')]
+    if not formats:
+        return {'format': fallback, 'video': None, 'audio': None, 'label': 'best', 'reason': "No format list available; letting yt-dlp choose."}
+
+    heights = sorted({f['height'] for f in formats if f.get('height')}, reverse=True)
+    height = target_height or (heights[0] if heights else None)
+    at_height = [f for f in formats if not height or f.get('height') == height]
+
+    videos = rank_formats(at_height, 'video', container)
+    audios = rank_formats(formats, 'audio', container)
+    combined = sorted(
+        [f for f in at_height if _has_video(f) and _has_audio(f)],
+        key=lambda f: (_video_key(f, container)[0] + _audio_key(f, container)[0], f.get('tbr') or 0, _size(f)),
+        reverse=True
+    )
+
+    options = []
+    if videos and audios:
+        v, a = videos[0], audios[0]
+        score = _video_key(v, container)[0] + _audio_key(a, container)[0]
+        options.append(((score, (v.get('tbr') or 0) + (a.get('tbr') or 0)), f"{v['format_id']}+{a['format_id']}", v, a))
+    if combined:
+        c = combined[0]
+        score = _video_key(c, container)[0] + _audio_key(c, container)[0]
+        options.append(((score, c.get('tbr') or 0), c['format_id'], c, c))
+    if not options:
+        return {'format': fallback, 'video': None, 'audio': None, 'label': 'best', 'reason': "No separate or combined streams at this resolution; letting yt-dlp choose."}
+
+    _, format_id, v, a = max(options, key=lambda o: o[0])
+    v_score = _codec_score(v.get('vcodec'), VIDEO_CODEC_SCORES[container])
+    a_score = _codec_score(a.get('acodec'), AUDIO_CODEC_SCORES[container])
+
+    label = f"{height}p " if height else ""
+    label += _describe(v, 'video') + " + " + _describe(a, 'audio')
+    if v is a:
+        label += " (single file)"
+
+    if v_score >= 2 and a_score >= 2:
+        reason = f"Native {container.upper()} codecs: merging and later edits are pure stream copies."
+    elif codec_family(v.get('vcodec')) is None or codec_family(a.get('acodec')) is None:
+        reason = "Codec not reported by the site; picked the highest bitrate stream."
+    else:
+        reason = f"No {container.upper()}-native codec available at this resolution; some steps may need re-encoding."
+
+    # Keep the selector-based fallback in case the ids disappear on re-extraction
+    return {'format': f"{format_id}/{fallback}", 'video': v, 'audio': a, 'label': label, 'reason': reason}
@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+
+# Upper bound for parallel HLS/DASH fragment downloads per video
+DEFAULT_FRAGMENT_WORKERS = int(os.environ.get("YTDLR_FRAGMENT_WORKERS", "8"))
+MIN_FRAGMENT_WORKERS = 1
+
+# Warning/error text yt-dlp logs when a fragment request is throttled
+THROTTLE_MARKERS = ('HTTP Error 429', 'HTTP Error 403', 'Too Many Requests')
+
+class AdaptiveFragmentLimiter:
+    """
+    Chooses the fragment concurrency for each site with additive-increase /
+    multiplicative-decrease: a throttled download halves the next download's
+    thread count for that site, a clean one adds a thread back (up to the maximum).
+
+    yt-dlp runs the fragment thread pool itself (`concurrent_fragment_downloads`)
+    over one pooled HTTP session, so this only decides how wide that pool is.
+    """
+    def __init__(self, max_workers=DEFAULT_FRAGMENT_WORKERS):
+        self.max_workers = max(MIN_FRAGMENT_WORKERS, max_workers)
+        self._current = {}
+        self._lock = threading.Lock()
+
+    def current(self, site):
+        with self._lock:
+            return self._current.get(site, self.max_workers)
+
+    def record_throttle(self, site):
+        with self._lock:
+            now = self._current.get(site, self.max_workers)
+            self._current[site] = max(MIN_FRAGMENT_WORKERS, now // 2)
+
+    def record_success(self, site):
+        with self._lock:
+            now = self._current.get(site, self.max_workers)
+            self._current[site] = min(self.max_workers, now + 1)
+
+class ThrottleWatchLogger:
+    """
+    yt-dlp `logger` for quiet downloads: swallows regular output like quiet mode,
+    still shows warnings/errors, and notes whether any request was throttled.
+    """
+    def __init__(self):
+        self.throttled = False
+
+    def _check(self, msg):
+        if any(marker in msg for marker in THROTTLE_MARKERS):
+            self.throttled = True
+
+    def debug(self, msg):
+        self._check(msg)
+
+    def info(self, msg):
+        self._check(msg)
+
+    def warning(self, msg):
+        self._check(msg)
+        print(msg, file=sys.stderr)
+
+    def error(self, msg):
+        self._check(msg)
+        print(msg, file=sys.stderr)
+
+_limiter = None
+
+def get_fragment_limiter():
+    """Returns the process-wide adaptive fragment limiter."""
+    global _limiter
+    if _limiter is None:
+        _limiter = AdaptiveFragmentLimiter()
+    return _limiter
+
+def set_fragment_workers(max_workers):
+    """Replaces the process-wide limiter with one capped at `max_workers` threads."""
+    global _limiter
+    _limiter = AdaptiveFragmentLimiter(max_workers)
+    return _limiter
@@ -0,0 +1,370 @@
+import os
+import random
+import hashlib
+import subprocess
+import concurrent.futures
+import numpy as np
+from PIL import Image
+
+from utils.cache import DiskCache, DEFAULT_CACHE_DIR
+
+# Ken Burns rendering settings shared by slideshow() and images_to_video()
+FPS = 30
+OUTPUT_SIZE = (1920, 1080)
+# Images are placed on a larger canvas first so zoomed-in frames stay sharp
+CANVAS_SIZE = (2560, 1440)
+EFFECTS = ['zoom_in', 'zoom_out', 'pan_left', 'pan_right', 'pan_up', 'pan_down']
+# Effect sequence used when no seed is given; fixed so re-runs can reuse cached clips
+DEFAULT_SEED = 0
+# Disk quota for rendered clips reused across runs (least recently used clips go first)
+CLIP_CACHE_MAX_BYTES = int(os.environ.get("YTDLR_CLIP_CACHE_MB", "2048")) * 1024 * 1024
+
+def prepare_canvas(img_path, canvas_size=CANVAS_SIZE):
+    """Loads an image, fits it into `canvas_size` and centres it on black. Returns an RGB PIL image."""
+    with Image.open(img_path) as img:
+        img = img.convert('RGB')
+
+        # Upscale to the canvas size for better quality when zooming
+        ratio = min(canvas_size[0] / img.width, canvas_size[1] / img.height)
+        new_size = (int(img.width * ratio), int(img.height * ratio))
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+
+        # Center on black background
+        canvas = Image.new('RGB', canvas_size, (0, 0, 0))
+        x = (canvas_size[0] - new_size[0]) // 2
+        y = (canvas_size[1] - new_size[1]) // 2
+        canvas.paste(img, (x, y))
+        return canvas
+
+def crop_boxes(effect, total_frames, canvas_size=CANVAS_SIZE, output_size=OUTPUT_SIZE):
+    """
+    Precomputes the canvas region shown in every frame of an effect.
+
+    Positions are kept fractional so slow pans and zooms move smoothly instead of
+    stepping a whole canvas pixel at a time.
+
+    Returns:
+        ndarray: Float (total_frames, 4) array of (left, top, width, height).
+    """
+    t = np.arange(total_frames, dtype=np.float64) / max(1, total_frames - 1)  # 0.0 to 1.0
+    if effect == 'zoom_in':
+        # Zoom from 1.0x to 1.1x (slower, more subtle)
+        zoom = 1.0 + (0.1 * t)
+    elif effect == 'zoom_out':
+        # Zoom from 1.1x to 1.0x (slower, more subtle)
+        zoom = 1.1 - (0.1 * t)
+    else:
+        zoom = np.full_like(t, 1.05)
+    crop_w = output_size[0] / zoom
+    crop_h = output_size[1] / zoom
+    left = (canvas_size[0] - crop_w) / 2
+    top = (canvas_size[1] - crop_h) / 2
+
+    if effect == 'pan_left':
+        # Pan from right to left (slower)
+        left = (canvas_size[0] - crop_w) * (1 - t)
+    elif effect == 'pan_right':
+        # Pan from left to right (slower)
+        left = (canvas_size[0] - crop_w) * t
+    elif effect == 'pan_up':
+        # Pan from bottom to top (slower)
+        top = (canvas_size[1] - crop_h) * (1 - t)
+    elif effect == 'pan_down':
+        # Pan from top to bottom (slower)
+        top = (canvas_size[1] - crop_h) * t
+    return np.stack([left, top, crop_w, crop_h], axis=1)
+
+def render_frames(canvas, effect, total_frames, output_size=OUTPUT_SIZE):
+    """
+    Yields the Ken Burns frames of one clip as raw RGB24 bytes, one at a time.
+
+    Each frame is a single bilinear scale + translate of the canvas from the frame's
+    fractional crop box.
+
+    Args:
+        canvas (PIL.Image): Prepared canvas from prepare_canvas().
+        effect (str): One of EFFECTS.
+        total_frames (int): Number of frames to render.
+        output_size (tuple): Frame (width, height).
+
+    Returns:
+        generator: Frames of width*height*3 bytes.
+    """
+    for left, top, width, height in crop_boxes(effect, total_frames, canvas.size, output_size):
+        # Pillow accepts a fractional source box, so motion is not snapped to whole pixels
+        box = (left, top, left + width, top + height)
+        yield canvas.resize(output_size, Image.Resampling.BILINEAR, box=box).tobytes()
+
+def open_encoder(output_path, fps=FPS, size=OUTPUT_SIZE, extra_args=None):
+    """
+    Starts an ffmpeg H.264 encoder that reads raw RGB24 frames of `size` from stdin.
+
+    Args:
+        output_path (str): Output video path.
+        fps (int): Frame rate.
+        size (tuple): Frame (width, height).
+        extra_args (list, optional): More ffmpeg arguments placed before the output path.
+
+    Returns:
+        subprocess.Popen: Process whose stdin takes width*height*3 bytes per frame.
+    """
+    cmd = [
+        "ffmpeg", "-y",
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-s", f"{size[0]}x{size[1]}",
+        "-framerate", str(fps),
+        "-i", "-",
+    ] + (extra_args or []) + [
+        "-c:v", "libx264",
+        "-pix_fmt", "yuv420p",
+        "-r", str(fps),
+        output_path
+    ]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def close_encoder(proc):
+    """Closes the encoder's stdin and waits for it. Raises CalledProcessError if ffmpeg failed."""
+    try:
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    if proc.wait() != 0:
+        raise subprocess.CalledProcessError(proc.returncode, "ffmpeg")
+
+def render_clip(img_path, effect, duration, clip_path, fps=FPS, threads=None):
+    """
+    Renders one image with a Ken Burns effect straight into an H.264 clip.
+
+    Frames go to ffmpeg as raw RGB over a pipe, so nothing is written to disk except
+    the clip, and only the canvas plus the frame in flight are held in memory.
+
+    Returns:
+        str: clip_path.
+    """
+    canvas = prepare_canvas(img_path)
+    proc = open_encoder(clip_path, fps, extra_args=["-threads", str(threads)] if threads else None)
+    try:
+        for frame in render_frames(canvas, effect, int(duration * fps)):
+            proc.stdin.write(frame)
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; close_encoder reports it
+    finally:
+        close_encoder(proc)
+    return clip_path
+
+def effect_for(img_path, occurrence, seed=DEFAULT_SEED):
+    """
+    Picks the effect for the `occurrence`-th clip (0-based) of an image.
+
+    The choice depends on the image content and the seed rather than the clip's
+    position, so adding or removing photos leaves the other clips' effects, and
+    their cached renders, unchanged.
+    """
+    try:
+        identity = image_hash(img_path)
+    except OSError:
+        identity = img_path  # Rendering will report the error
+    return random.Random(f"{seed}:{identity}:{occurrence}").choice(EFFECTS)
+
+def _render_job(job, duration, fps, threads):
+    img_path, effect, clip_path = job
+    return render_clip(img_path, effect, duration, clip_path, fps, threads=threads)
+
+_image_hashes = {}
+
+def image_hash(img_path):
+    """Returns the SHA-256 of an image file's bytes (remembered while the file is unchanged)."""
+    st = os.stat(img_path)
+    memo_key = (os.path.abspath(img_path), st.st_mtime_ns, st.st_size)
+    if memo_key not in _image_hashes:
+        h = hashlib.sha256()
+        with open(img_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        _image_hashes[memo_key] = h.hexdigest()
+    return _image_hashes[memo_key]
+
+def clip_cache_key(img_hash, effect, duration, fps=FPS, size=OUTPUT_SIZE):
+    """Cache key for the clip of image content `img_hash` rendered with `effect`."""
+    return f"clip:{img_hash}:{effect}:{duration:g}:{fps}:{size[0]}x{size[1]}"
+
+_clip_cache = None
+
+def get_clip_cache():
+    """Returns the process-wide rendered clip cache."""
+    global _clip_cache
+    if _clip_cache is None:
+        _clip_cache = DiskCache(os.path.join(DEFAULT_CACHE_DIR, "clips"), max_bytes=CLIP_CACHE_MAX_BYTES)
+    return _clip_cache
+
+def render_clips(jobs, duration, fps=FPS, workers=None, cache=None):
+    """
+    Renders clips in parallel, one process per clip at a time.
+
+    With a cache, jobs for the same image content and effect are rendered once, and
+    clips rendered by earlier runs are used straight from the cache. Only this
+    process touches the cache; workers just render.
+
+    Args:
+        jobs (list): (img_path, effect, clip_path) tuples.
+        duration (float): Seconds per clip.
+        fps (int): Frame rate.
+        workers (int, optional): Worker processes. Defaults to one per core.
+        cache (DiskCache, optional): Clip cache, e.g. get_clip_cache().
+
+    Returns:
+        list: (clip_path, error) per job in job order; clip_path is None when the job
+            failed, and points into the cache for reused clips.
+    """
+    results = [None] * len(jobs)
+    groups = {}  # Cache key (or job index when uncached) -> indexes of the jobs it serves
+    for i, (img_path, effect, _) in enumerate(jobs):
+        key = i
+        if cache is not None:
+            try:
+                key = clip_cache_key(image_hash(img_path), effect, duration, fps)
+            except OSError as e:
+                results[i] = (None, str(e))
+                continue
+        groups.setdefault(key, []).append(i)
+
+    to_render, reused = [], []
+    for key, indexes in groups.items():
+        cached = cache.get_files(key) if cache is not None else None
+        if cached:
+            reused.append(key)
+            for i in indexes:
+                results[i] = (cached['clip'], None)
+        else:
+            to_render.append(key)
+    if reused:
+        hits = sum(len(groups[key]) for key in reused)
+        print(f"♻️ Reusing {hits} of {len(jobs)} clips from the render cache")
+
+    rendered = _render_jobs([jobs[groups[key][0]] for key in to_render], duration, fps, workers)
+    for key, (clip_path, error) in zip(to_render, rendered):
+        if cache is not None and clip_path and os.path.exists(clip_path):
+            # The jobs keep the freshly rendered file; the cache gets a copy for later runs
+            cache.put_files(key, {'clip': clip_path})
+        for i in groups[key]:
+            results[i] = (clip_path, error)
+
+    # Storing new clips may have evicted reused ones; render those again
+    evicted = [key for key in reused if not os.path.exists(results[groups[key][0]][0])]
+    if evicted:
+        rerendered = _render_jobs([jobs[groups[key][0]] for key in evicted], duration, fps, workers)
+        for key, result in zip(evicted, rerendered):
+            for i in groups[key]:
+                results[i] = result
+    return results
+
+def _render_jobs(jobs, duration, fps=FPS, workers=None):
+    if not jobs:
+        return []
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, len(jobs) or 1))
+    # Share the cores between the workers' x264 encoders instead of each using all of them
+    threads = max(1, cpus // workers)
+    results = [(None, None)] * len(jobs)
+
+    if workers == 1:
+        for i, job in enumerate(jobs):
+            try:
+                results[i] = (_render_job(job, duration, fps, None), None)
+                print(f"  ✓ Clip {i + 1}/{len(jobs)} rendered")
+            except Exception as e:
+                results[i] = (None, str(e))
+        return results
+
+    done = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_render_job, job, duration, fps, threads): i for i, job in enumerate(jobs)}
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = (future.result(), None)
+                done += 1
+                print(f"  ✓ Clip {done}/{len(jobs)} rendered")
+            except Exception as e:
+                results[i] = (None, str(e))
+    return results
+
+def crossfade(a, b, alpha):
+    """Blends two RGB24 frames: `alpha` 0.0 is all `a`, 1.0 is all `b`."""
+    w = int(round(alpha * 256))
+    a = np.frombuffer(a, dtype=np.uint8).astype(np.uint16)
+    b = np.frombuffer(b, dtype=np.uint8).astype(np.uint16)
+    a *= 256 - w
+    a += b * w
+    a >>= 8
+    return a.astype(np.uint8)
+
+def slideshow_frames(plan, duration, fps=FPS, transition=0.0, on_error=None):
+    """
+    Yields the frames of a whole slideshow, image after image.
+
+    With a transition, each image's motion runs `transition` seconds longer and
+    that overhang is crossfaded into the start of the next image, so every image
+    still occupies exactly `duration` seconds. Only the current and previous image
+    canvases are held in memory.
+
+    Args:
+        plan (iterable): (img_path, effect) pairs; may be a generator.
+        duration (float): Seconds per image.
+        fps (int): Frame rate.
+        transition (float): Crossfade length in seconds (0 = hard cuts).
+        on_error (callable, optional): Called as on_error(img_path, exception) for
+            images that cannot be loaded; they are skipped.
+
+    Returns:
+        generator: Bytes-like RGB24 frames.
+    """
+    slot = int(duration * fps)
+    fade = min(int(transition * fps), slot)
+    previous = None  # The previous image's remaining frames, faded out over the next one
+    for img_path, effect in plan:
+        try:
+            canvas = prepare_canvas(img_path)
+        except Exception as e:
+            if on_error:
+                on_error(img_path, e)
+            continue
+        frames = render_frames(canvas, effect, slot + fade)
+        for i in range(slot):
+            frame = next(frames)
+            if previous is not None and i < fade:
+                frame = crossfade(next(previous), frame, (i + 1) / (fade + 1))
+            yield frame
+        previous = frames if fade else None
+
+def render_slideshow(plan, duration, output_path, audio_path=None, fps=FPS, transition=0.0, on_error=None):
+    """
+    Encodes a whole slideshow with one ffmpeg process, muxing the audio in the same pass.
+
+    Args:
+        plan (iterable): (img_path, effect) pairs; may be a generator.
+        duration (float): Seconds per image.
+        output_path (str): Output video path.
+        audio_path (str, optional): Audio track; the video is cut to the shorter of the two.
+        fps (int): Frame rate.
+        transition (float): Crossfade length in seconds between images.
+        on_error (callable, optional): See slideshow_frames().
+
+    Returns:
+        int: Number of frames written.
+    """
+    extra_args = None
+    if audio_path:
+        extra_args = ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0", "-c:a", "aac", "-shortest"]
+    proc = open_encoder(output_path, fps, extra_args=extra_args)
+    written = 0
+    try:
+        for frame in slideshow_frames(plan, duration, fps, transition, on_error=on_error):
+            proc.stdin.write(frame)
+            written += 1
+    except BrokenPipeError:
+        pass  # -shortest stops reading once the audio ends
+    finally:
+        close_encoder(proc)
+    return written
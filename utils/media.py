@@ -1,9 +1,12 @@
 import os
 import shutil
 import subprocess
-import random
-from PIL import Image
+import tempfile
+import numpy as np
 from pillow_heif import register_heif_opener
+from utils.spectral import center_cancel, is_mono
+from utils.kenburns import FPS, DEFAULT_SEED, effect_for, render_clips, render_slideshow, get_clip_cache
+from utils.separation import decode_window, get_engine, get_stem_cache, resumable_work_dir, audio_fingerprint, stem_cache_key, CHUNKED_MIN_SECONDS, MP3_BITRATE, FINGERPRINT_SAMPLERATE, FINGERPRINT_CHANNELS
 
 # Register HEIF/HEIC support for PIL
 register_heif_opener()
@@ -12,16 +15,97 @@ def check_ffmpeg_installed():
     """Checks if ffmpeg is available in the system path."""
     return shutil.which("ffmpeg") is not None
 
-def process_vocal_removal(input_path, progress_callback=None):
+def has_video_stream(input_path):
+    """
+    Returns True if the file contains at least one video stream (uses ffprobe).
+    """
+    try:
+        cmd = [
+            "ffprobe",
+            "-v", "error",
+            "-select_streams", "v",
+            "-show_entries", "stream=index",
+            "-of", "csv=p=0",
+            input_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return bool(result.stdout.strip())
+    except Exception:
+        return False
+
+def extract_audio(input_path, output_path, samplerate=FINGERPRINT_SAMPLERATE, channels=FINGERPRINT_CHANNELS):
+    """
+    Decodes only the first audio stream of a file into a 16-bit PCM WAV (video is never decoded).
+    Past the 4 GB WAV limit (about 6.7 h at 44.1 kHz stereo) the file switches to RF64.
+
+    Returns:
+        str: output_path, or None if failed.
+    """
+    try:
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", input_path,
+            "-map", "0:a:0",
+            "-vn", "-sn", "-dn",
+            "-c:a", "pcm_s16le",
+            "-ar", str(samplerate),
+            "-ac", str(channels),
+            "-rf64", "auto",
+            output_path
+        ]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return output_path if os.path.exists(output_path) else None
+    except Exception as e:
+        print(f"❌ Error extracting audio: {e}")
+        return None
+
+def publish_file(src, dst):
+    """
+    Moves a finished file into place atomically: readers see either the old file or the
+    complete new one. Falls back to copy + rename when `dst` is on another filesystem.
+    """
+    try:
+        os.replace(src, dst)
+    except OSError:
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+        os.remove(src)
+    return dst
+
+# Artifacts process_vocal_removal can create, and their default file name suffixes
+VOCAL_REMOVAL_OUTPUTS = ('mp3', 'vocals_mp3', 'mp4')
+VOCAL_REMOVAL_SUFFIXES = {
+    'mp3': "_instrumental.mp3",
+    'vocals_mp3': "_vocals.mp3",
+    'mp4': "_instrumental.mp4",
+}
+
+def process_vocal_removal(input_path, progress_callback=None, video_source=None, engine=None, outputs=None,
+                          output_dir=None, output_paths=None):
     """
     Removes vocals from the input file using Demucs and merges the result.
+
+    Every job works in its own scratch folder and each finished output is moved into
+    place atomically, so concurrent jobs (even on files with the same name) never see
+    or overwrite each other's intermediate files.
     
     Args:
         input_path (str): Path to the input video/audio file.
         progress_callback (func, optional): Callback for status updates (msg: str).
+        video_source (str or func, optional): Video for the karaoke MP4. Defaults to input_path.
+            A callable is only invoked (e.g. to download the video stream) once the MP4 is made,
+            so audio-only jobs never fetch video.
+        engine (SeparationEngine, optional): Loaded engine to reuse. Defaults to the process-wide one.
+        outputs (iterable, optional): Which of VOCAL_REMOVAL_OUTPUTS to create ('mp3' instrumental,
+            'vocals_mp3' isolated vocals, 'mp4' karaoke video). Defaults to all three; stems,
+            encodes and muxes nobody asked for are skipped.
+        output_dir (str, optional): Folder for the outputs. Defaults to the current folder.
+        output_paths (dict, optional): Explicit path per output, overriding the default
+            `<output_dir>/<input name><suffix>` names.
         
     Returns:
-        dict: A dictionary containing paths to 'mp3' and 'mp4' instrumental files, or None on failure.
+        dict: Paths of the created outputs (keys from `outputs`), or None on failure.
     """
     def log(msg):
         if progress_callback:
@@ -32,69 +116,196 @@ def process_vocal_removal(input_path, progress_callback=None):
     if not os.path.exists(input_path):
         log(f"❌ Error: File '{input_path}' not found.")
         return None
+
+    outputs = set(VOCAL_REMOVAL_OUTPUTS if outputs is None else outputs)
+    needed_stems = set()
+    if outputs & {'mp3', 'mp4'}:
+        needed_stems.add('no_vocals')
+    if 'vocals_mp3' in outputs:
+        needed_stems.add('vocals')
+    if not needed_stems:
+        log("❌ Error: No outputs requested.")
+        return None
+
+    filename_no_ext = os.path.splitext(os.path.basename(input_path))[0]
+    targets = {key: os.path.join(output_dir or "", f"{filename_no_ext}{suffix}") for key, suffix in VOCAL_REMOVAL_SUFFIXES.items()}
+    targets.update(output_paths or {})
         
     log(f"🎤 Separating vocals for: {input_path} (this may take a few minutes)...")
     
+    # Scratch space next to the outputs, so publishing is a same-filesystem rename
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=".ytdlr_sep_", dir=output_dir or ".")
+    encoders = {}
     try:
-        # Run Demucs
-        subprocess.run(["demucs", "--mp3", "--two-stems=vocals", "-n", "htdemucs", input_path], check=True)
-        
-        filename_no_ext = os.path.splitext(os.path.basename(input_path))[0]
-        demucs_out_dir = os.path.join("separated", "htdemucs", filename_no_ext)
-        
-        # Fallback search if directory name is truncated or slightly different
-        if not os.path.exists(demucs_out_dir):
-            potential_dirs = [d for d in os.listdir(os.path.join("separated", "htdemucs")) if d.startswith(filename_no_ext[:10])]
-            if potential_dirs:
-                demucs_out_dir = os.path.join("separated", "htdemucs", potential_dirs[0])
-        
-        no_vocals_path = os.path.join(demucs_out_dir, "no_vocals.mp3")
-        vocals_path = os.path.join(demucs_out_dir, "vocals.mp3")
+        # Decode just the audio track once; hashing, probing and Demucs all read this
+        # WAV instead of demuxing the whole (possibly HD) video container again
+        audio_path = extract_audio(input_path, os.path.join(work_dir, "audio.wav"))
+        if not audio_path:
+            log("❌ Error: Could not extract an audio track.")
+            return None
+
+        # Run Demucs in-process (model stays loaded between calls)
+        engine = engine or get_engine()
+        stems_dir = os.path.join(work_dir, "stems")
+        # Same decoded audio + model + stems = same result, so reuse earlier separations
+        stem_cache = get_stem_cache()
+        fingerprint = audio_fingerprint(audio_path)
+        cache_key = stem_cache_key(fingerprint, engine.cache_tag, "vocals", ext="wav") if fingerprint else None
+        cached = stem_cache.get_files(cache_key) if cache_key else None
+
+        if cached and needed_stems <= set(cached):
+            log("⚡ Reusing cached stems (same audio separated before)")
+            os.makedirs(stems_dir)
+            stems = {}
+            for name in needed_stems:
+                stems[name] = os.path.join(stems_dir, os.path.basename(cached[name]))
+                shutil.copy2(cached[name], stems[name])
+        else:
+            duration = get_video_duration(audio_path)
+            if duration and duration >= CHUNKED_MIN_SECONDS:
+                # Long inputs are separated window by window (bounded memory, resumable)
+                job_key = f"{fingerprint or os.path.abspath(input_path)}:{engine.cache_tag}:{sorted(needed_stems)}"
+                with resumable_work_dir(job_key, os.path.join(work_dir, "chunks")) as chunks_dir:
+                    stems = engine.separate_chunked(audio_path, stems_dir, two_stems="vocals", ext="wav", work_dir=chunks_dir,
+                                                    progress_callback=log, source_id=fingerprint, keep=needed_stems)
+            else:
+                stems = engine.separate_to_files(audio_path, stems_dir, two_stems="vocals", ext="wav", keep=needed_stems)
+            if cache_key:
+                stem_cache.put_files(cache_key, dict(cached or {}, **stems))
+
+        if not all(name in stems and os.path.exists(stems[name]) for name in needed_stems):
+            log("❌ Separation failed: Output not found.")
+            return None
+
         created_files = {}
 
-        if os.path.exists(no_vocals_path):
-            # 1. Instrumental MP3
-            mp3_file = f"{filename_no_ext}_instrumental.mp3"
-            shutil.move(no_vocals_path, mp3_file)
-            log(f"✅ Created Instrumental Audio: {mp3_file}")
-            created_files['mp3'] = mp3_file
-
-            # 2. Isolated Vocals MP3
-            if os.path.exists(vocals_path):
-                vocals_mp3_file = f"{filename_no_ext}_vocals.mp3"
-                shutil.move(vocals_path, vocals_mp3_file)
-                log(f"✅ Created Isolated Vocals: {vocals_mp3_file}")
-                created_files['vocals_mp3'] = vocals_mp3_file
-            
-            # 2. Instrumental MP4
-            if check_ffmpeg_installed():
-                log("🎥 Merging instrumental audio with video...")
-                mp4_file = f"{filename_no_ext}_instrumental.mp4"
+        # 1./2. MP3s are encoded from the PCM stems only when asked for, in the background
+        # while the karaoke video is fetched and muxed
+        for key, stem, label in (('mp3', 'no_vocals', "Instrumental Audio"), ('vocals_mp3', 'vocals', "Isolated Vocals")):
+            if key in outputs:
+                mp3_tmp = os.path.join(work_dir, f"{key}.mp3")
                 cmd = [
                     "ffmpeg", "-y",
-                    "-i", input_path,
-                    "-i", mp3_file,
-                    "-c:v", "copy",
-                    "-c:a", "aac",
-                    "-map", "0:v:0",
-                    "-map", "1:a:0",
-                    "-shortest",
-                    mp4_file
+                    "-i", stems[stem],
+                    "-c:a", "libmp3lame",
+                    "-b:a", f"{MP3_BITRATE}k",
+                    mp3_tmp
                 ]
-                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                if os.path.exists(mp4_file):
-                    log(f"✅ Created Karaoke Video: {mp4_file}")
-                    created_files['mp4'] = mp4_file
-            else:
-                log("⚠️ FFmpeg not found. Skipping video merge.")
-            
-            return created_files
-        else:
-            log("❌ Separation failed: Output not found.")
-            return None
+                encoders[key] = (subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), mp3_tmp, label)
+
+        try:
+            # 3. Instrumental MP4: the PCM stem is encoded to AAC once, in the muxing pass
+            if 'mp4' in outputs:
+                video_path = video_source if video_source is not None else input_path
+                if not check_ffmpeg_installed():
+                    log("⚠️ FFmpeg not found. Skipping video merge.")
+                    video_path = None
+                elif callable(video_path):
+                    log("📥 Fetching video stream for karaoke video...")
+                    video_path = video_path()
+
+                if video_path and not has_video_stream(video_path):
+                    log("ℹ️ No video stream available. Skipping karaoke video.")
+                elif video_path:
+                    log("🎥 Merging instrumental audio with video...")
+                    mp4_tmp = os.path.join(work_dir, "karaoke.mp4")
+                    cmd = [
+                        "ffmpeg", "-y",
+                        "-i", video_path,
+                        "-i", stems['no_vocals'],
+                        "-c:v", "copy",
+                        "-c:a", "aac",
+                        "-b:a", "256k",
+                        "-map", "0:v:0",
+                        "-map", "1:a:0",
+                        "-shortest",
+                        mp4_tmp
+                    ]
+                    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    if os.path.exists(mp4_tmp):
+                        publish_file(mp4_tmp, targets['mp4'])
+                        log(f"✅ Created Karaoke Video: {targets['mp4']}")
+                        created_files['mp4'] = targets['mp4']
+        finally:
+            # Finished MP3s are published even when the video step fails
+            for key, (proc, mp3_tmp, label) in encoders.items():
+                if proc.wait() != 0 or not os.path.exists(mp3_tmp):
+                    log(f"❌ Error encoding {label} MP3.")
+                    continue
+                publish_file(mp3_tmp, targets[key])
+                log(f"✅ Created {label}: {targets[key]}")
+                created_files[key] = targets[key]
+
+        return created_files
     except Exception as e:
         log(f"❌ Error removing vocals: {e}")
         return None
+    finally:
+        for proc, _, _ in encoders.values():
+            proc.kill()  # Only still running if the job failed part-way
+            proc.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# Length of the quick karaoke preview
+PREVIEW_SECONDS = 30
+
+def preview_vocal_removal(input_path, start=None, duration=PREVIEW_SECONDS, output_dir=None):
+    """
+    Fast, rough vocal removal of a short excerpt (about a second of CPU) so users can
+    judge whether the full Demucs run is worth it. Uses STFT centre-channel masking,
+    so it only works on stereo mixes with centre-panned vocals.
+
+    Args:
+        input_path (str): Path to the input video/audio file.
+        start (float, optional): Excerpt start in seconds. Defaults to a third of the way in.
+        duration (float): Excerpt length in seconds.
+        output_dir (str, optional): Folder for the preview files. Defaults to the current folder.
+
+    Returns:
+        dict: Paths to 'instrumental' and 'vocals' preview MP3s, or None on failure.
+    """
+    if not check_ffmpeg_installed():
+        print("❌ Error: FFmpeg not installed.")
+        return None
+
+    if start is None:
+        total = get_video_duration(input_path) or 0
+        start = max(0.0, min(total / 3, total - duration))
+
+    try:
+        samplerate = FINGERPRINT_SAMPLERATE
+        audio = decode_window(input_path, start, duration, samplerate, 2)
+        if audio.shape[1] == 0:
+            print("❌ Error: No audio in the selected excerpt.")
+            return None
+        if is_mono(audio):
+            print("⚠️ Mono audio: the quick preview cannot separate it. Use the full separation.")
+            return None
+
+        instrumental, vocals = center_cancel(audio, samplerate)
+
+        filename_no_ext = os.path.splitext(os.path.basename(input_path))[0]
+        created_files = {}
+        for name, stem in (('instrumental', instrumental), ('vocals', vocals)):
+            output_path = os.path.join(output_dir or "", f"{filename_no_ext}_preview_{name}.mp3")
+            peak = float(np.abs(stem).max(initial=0.0))
+            if peak > 1.0:
+                stem = stem / (1.01 * peak)
+            cmd = [
+                "ffmpeg", "-y", "-v", "error",
+                "-f", "f32le", "-ar", str(samplerate), "-ac", "2",
+                "-i", "-",
+                "-c:a", "libmp3lame", "-b:a", "192k",
+                output_path
+            ]
+            subprocess.run(cmd, input=np.ascontiguousarray(stem.T, dtype="<f4").tobytes(), check=True)
+            created_files[name] = output_path
+        return created_files
+    except Exception as e:
+        print(f"❌ Error creating preview: {e}")
+        return None
 
 def mute_video(input_path, output_path=None):
     """
@@ -138,6 +349,33 @@ def mute_video(input_path, output_path=None):
         print(f"❌ Error muting video: {e}")
         return None
 
+def parse_time(time_str):
+    """
+    Parses a time/duration string into seconds.
+    
+    Args:
+        time_str (str): "1h", "30m", "10s", "90" (seconds) or "HH:MM:SS(.ms)".
+        
+    Returns:
+        float: Seconds, or None if the string is invalid.
+    """
+    try:
+        s = str(time_str).lower().strip()
+        if ':' in s:
+            seconds = 0.0
+            for part in s.split(':'):
+                seconds = seconds * 60 + float(part)
+            return seconds
+        if s.endswith('h'):
+            return float(s[:-1]) * 3600
+        elif s.endswith('m'):
+            return float(s[:-1]) * 60
+        elif s.endswith('s'):
+            return float(s[:-1])
+        return float(s)
+    except (ValueError, AttributeError):
+        return None
+
 def get_video_duration(input_path):
     """
     Returns the duration of the video in seconds using ffprobe.
@@ -176,18 +414,8 @@ def loop_video(input_path, target_duration_str):
         return None
 
     # Parse duration
-    total_seconds = 0
-    try:
-        s = target_duration_str.lower().strip()
-        if s.endswith('h'):
-            total_seconds = float(s[:-1]) * 3600
-        elif s.endswith('m'):
-            total_seconds = float(s[:-1]) * 60
-        elif s.endswith('s'):
-            total_seconds = float(s[:-1])
-        else:
-            total_seconds = float(s)
-    except:
+    total_seconds = parse_time(target_duration_str)
+    if total_seconds is None:
         print(f"❌ Invalid duration format: {target_duration_str}")
         return None
         
@@ -223,7 +451,7 @@ def loop_video(input_path, target_duration_str):
         print(f"❌ Error looping video: {e}")
         return None
 
-def clip_video(input_path, start_time, duration=None):
+def clip_video(input_path, start_time, duration=None, output_path=None):
     """
     Clips the input video from start_time.
     
@@ -231,6 +459,7 @@ def clip_video(input_path, start_time, duration=None):
         input_path (str): Path to input video.
         start_time (str): Start time (e.g., "00:00:10", "10", "10s").
         duration (str, optional): Duration to keep. If None, clips to end.
+        output_path (str, optional): Custom output path. Defaults to *_clipped.mp4
         
     Returns:
         str: Path to clipped video or None.
@@ -243,8 +472,9 @@ def clip_video(input_path, start_time, duration=None):
         print(f"❌ Error: File '{input_path}' not found.")
         return None
         
-    filename_no_ext = os.path.splitext(input_path)[0]
-    output_path = f"{filename_no_ext}_clipped.mp4"
+    if not output_path:
+        filename_no_ext = os.path.splitext(input_path)[0]
+        output_path = f"{filename_no_ext}_clipped.mp4"
     
     msg = f"✂️ Clipping video from {start_time}"
     if duration:
@@ -449,7 +679,27 @@ def image_to_video(image_path, audio_path, output_path=None):
         print(f"❌ Error creating video from image: {e}")
         return None
 
-def slideshow(image_paths, audio_path, duration_per_image=3.0, output_path=None):
+def concat_entry(path):
+    """Returns `path` quoted for a line of an ffmpeg concat list (file '...')."""
+    return os.path.abspath(path).replace("'", "'\\''")
+
+def _single_pass_slideshow(plan, audio_path, duration_per_image, output_path, transition, on_error):
+    if transition:
+        print(f"🎥 Rendering and encoding in one pass with {transition:g}s crossfades...")
+    else:
+        print(f"🎥 Rendering and encoding in one pass...")
+    try:
+        frames = render_slideshow(plan, duration_per_image, output_path, audio_path, transition=transition, on_error=on_error)
+        if frames and os.path.exists(output_path):
+            return output_path
+        print("❌ Error: No frames were rendered.")
+        return None
+    except Exception as e:
+        print(f"❌ Error creating slideshow: {e}")
+        return None
+
+def slideshow(image_paths, audio_path, duration_per_image=3.0, output_path=None, workers=None, seed=None,
+              single_pass=False, transition=0.0):
     """
     Creates a 1080p slideshow from a list of images and an audio file with Ken Burns effects.
     Shows each image exactly once - does not loop to match audio duration.
@@ -462,6 +712,11 @@ def slideshow(image_paths, audio_path, duration_per_image=3.0, output_path=None)
         audio_path (str): Path to the audio file.
         duration_per_image (float): Duration for each image in seconds.
         output_path (str, optional): Path for the output video.
+        workers (int, optional): Clips rendered in parallel. Defaults to one per core.
+        seed (int, optional): Seed for the effect sequence. Defaults to DEFAULT_SEED.
+        single_pass (bool): Encode everything with one ffmpeg process fed straight from the
+            frame generator, audio included, instead of rendering, concatenating and muxing clips.
+        transition (float): Crossfade seconds between images. Implies single_pass.
         
     Returns:
         str: Path to the new video file, or None if failed.
@@ -478,6 +733,16 @@ def slideshow(image_paths, audio_path, duration_per_image=3.0, output_path=None)
         print(f"❌ Error: Audio file '{audio_path}' not found.")
         return None
     
+    if seed is None:
+        seed = DEFAULT_SEED
+
+    if single_pass or transition:
+        print(f"🖼️ Creating slideshow with Ken Burns effects for {len(image_paths)} images...")
+        plan = ((img_path, effect_for(img_path, 0, seed)) for img_path in image_paths)
+        def on_error(img_path, e):
+            print(f"⚠️ Warning: Could not process image {img_path}: {e}")
+        return _single_pass_slideshow(plan, audio_path, duration_per_image, output_path or "slideshow.mp4", transition, on_error)
+
     # Create temp directory for processing
     temp_dir = os.path.join(os.path.dirname(image_paths[0]), "temp_slideshow")
     if os.path.exists(temp_dir):
@@ -487,134 +752,31 @@ def slideshow(image_paths, audio_path, duration_per_image=3.0, output_path=None)
     print(f"🖼️ Creating slideshow with Ken Burns effects for {len(image_paths)} images...")
     
     try:
-        fps = 30
-        total_frames = int(duration_per_image * fps)
-        output_size = (1920, 1080)
-        
-        # Ken Burns effect types
-        effects = ['zoom_in', 'zoom_out', 'pan_left', 'pan_right', 'pan_up', 'pan_down']
+        fps = FPS
         
         clips = []
         
         print(f"🎥 Rendering {len(image_paths)} clips with Python-generated Ken Burns effects...")
         
-        for img_idx, img_path in enumerate(image_paths):
-            try:
-                # Load and prepare image at high resolution for quality
-                with Image.open(img_path) as img:
-                    img = img.convert('RGB')
-                    
-                    # Upscale to 2560x1440 for better quality when zooming
-                    target_size = (2560, 1440)
-                    ratio = min(target_size[0] / img.width, target_size[1] / img.height)
-                    new_size = (int(img.width * ratio), int(img.height * ratio))
-                    img = img.resize(new_size, Image.Resampling.LANCZOS)
-                    
-                    # Center on black background
-                    canvas = Image.new('RGB', target_size, (0, 0, 0))
-                    x = (target_size[0] - new_size[0]) // 2
-                    y = (target_size[1] - new_size[1]) // 2
-                    canvas.paste(img, (x, y))
-                    
-                    # Choose random effect
-                    effect = random.choice(effects)
-                    
-                    # Create frames directory for this clip
-                    frames_dir = os.path.join(temp_dir, f"frames_{img_idx:05d}")
-                    os.makedirs(frames_dir, exist_ok=True)
-                    
-                    # Generate frames with Ken Burns effect
-                    for frame_num in range(total_frames):
-                        t = frame_num / (total_frames - 1)  # 0.0 to 1.0
-                        
-                        if effect == 'zoom_in':
-                            # Zoom from 1.0x to 1.1x (slower, more subtle)
-                            zoom = 1.0 + (0.1 * t)
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = (target_size[0] - crop_w) // 2
-                            crop_y = (target_size[1] - crop_h) // 2
-                            
-                        elif effect == 'zoom_out':
-                            # Zoom from 1.1x to 1.0x (slower, more subtle)
-                            zoom = 1.1 - (0.1 * t)
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = (target_size[0] - crop_w) // 2
-                            crop_y = (target_size[1] - crop_h) // 2
-                            
-                        elif effect == 'pan_left':
-                            # Pan from right to left (slower)
-                            zoom = 1.05
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = int((target_size[0] - crop_w) * (1 - t))
-                            crop_y = (target_size[1] - crop_h) // 2
-                            
-                        elif effect == 'pan_right':
-                            # Pan from left to right (slower)
-                            zoom = 1.05
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = int((target_size[0] - crop_w) * t)
-                            crop_y = (target_size[1] - crop_h) // 2
-                            
-                        elif effect == 'pan_up':
-                            # Pan from bottom to top (slower)
-                            zoom = 1.05
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = (target_size[0] - crop_w) // 2
-                            crop_y = int((target_size[1] - crop_h) * (1 - t))
-                            
-                        else:  # pan_down
-                            # Pan from top to bottom (slower)
-                            zoom = 1.05
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = (target_size[0] - crop_w) // 2
-                            crop_y = int((target_size[1] - crop_h) * t)
-                        
-                        # Crop and resize to output size
-                        cropped = canvas.crop((crop_x, crop_y, crop_x + crop_w, crop_y + crop_h))
-                        frame = cropped.resize(output_size, Image.Resampling.LANCZOS)
-                        
-                        # Save frame
-                        frame_path = os.path.join(frames_dir, f"frame_{frame_num:05d}.jpg")
-                        frame.save(frame_path, "JPEG", quality=95)
-                    
-                    # Encode frames to video clip
-                    clip_path = os.path.join(temp_dir, f"clip_{img_idx:05d}.mp4")
-                    cmd = [
-                        "ffmpeg", "-y",
-                        "-framerate", str(fps),
-                        "-i", os.path.join(frames_dir, "frame_%05d.jpg"),
-                        "-c:v", "libx264",
-                        "-pix_fmt", "yuv420p",
-                        "-r", str(fps),
-                        clip_path
-                    ]
-                    
-                    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                    
-                    if os.path.exists(clip_path):
-                        clips.append(clip_path)
-                    
-                    # Clean up frames
-                    shutil.rmtree(frames_dir)
-                    
-            except Exception as e:
-                print(f"⚠️ Warning: Could not process image {img_path}: {e}")
+        jobs = [
+            (img_path, effect_for(img_path, 0, seed), os.path.join(temp_dir, f"clip_{img_idx:05d}.mp4"))
+            for img_idx, img_path in enumerate(image_paths)
+        ]
+        for (img_path, _, _), (clip_path, error) in zip(jobs, render_clips(jobs, duration_per_image, fps, workers, cache=get_clip_cache())):
+            if clip_path and os.path.exists(clip_path):
+                clips.append(clip_path)
+            elif error:
+                print(f"⚠️ Warning: Could not process image {img_path}: {error}")
 
         if not clips:
             print("❌ Error: No clips were generated.")
             return None
 
-        # Concatenate Clips
+        # Concatenate Clips (reused ones live in the render cache, so paths are absolute)
         concat_list_path = os.path.join(temp_dir, "concat.txt")
         with open(concat_list_path, "w") as f:
             for clip in clips:
-                f.write(f"file '{os.path.basename(clip)}'\n")
+                f.write(f"file '{concat_entry(clip)}'\n")
         
         if not output_path:
             filename_no_ext = "slideshow"
@@ -650,7 +812,8 @@ def slideshow(image_paths, audio_path, duration_per_image=3.0, output_path=None)
             shutil.rmtree(temp_dir)
         return None
 
-def images_to_video(image_paths, audio_path, duration_per_image=3.0, output_path=None):
+def images_to_video(image_paths, audio_path, duration_per_image=3.0, output_path=None, workers=None, seed=None,
+                    single_pass=False, transition=0.0):
     """
     Creates a 1080p video slideshow from a list of images and an audio file with Ken Burns effects.
     
@@ -662,6 +825,11 @@ def images_to_video(image_paths, audio_path, duration_per_image=3.0, output_path
         audio_path (str): Path to the audio file.
         duration_per_image (float): Duration for each image in seconds.
         output_path (str, optional): Path for the output video.
+        workers (int, optional): Clips rendered in parallel. Defaults to one per core.
+        seed (int, optional): Seed for the effect sequence. Defaults to DEFAULT_SEED.
+        single_pass (bool): Encode everything with one ffmpeg process fed straight from the
+            frame generator, audio included, instead of rendering, concatenating and muxing clips.
+        transition (float): Crossfade seconds between images. Implies single_pass.
         
     Returns:
         str: Path to the new video file, or None if failed.
@@ -678,6 +846,36 @@ def images_to_video(image_paths, audio_path, duration_per_image=3.0, output_path
         print(f"❌ Error: Audio file '{audio_path}' not found.")
         return None
     
+    if seed is None:
+        seed = DEFAULT_SEED
+
+    if single_pass or transition:
+        print(f"🖼️ Preparing slideshow with Ken Burns effects for {len(image_paths)} images...")
+        audio_duration = get_video_duration(audio_path) or len(image_paths) * duration_per_image
+        clips_needed = int(audio_duration / duration_per_image) + 1
+        failed_images = []
+
+        def plan():
+            # Cycle through the images (skipping failed ones) until enough rendered to fill the audio
+            occurrences = {}
+            img_cycle_index = 0
+            planned = 0
+            while planned - len(failed_images) < clips_needed and len(failed_images) < len(image_paths):
+                img_path = image_paths[img_cycle_index % len(image_paths)]
+                img_cycle_index += 1
+                if img_path in failed_images:
+                    continue
+                occurrence = occurrences.get(img_path, 0)
+                occurrences[img_path] = occurrence + 1
+                planned += 1
+                yield img_path, effect_for(img_path, occurrence, seed)
+
+        def on_error(img_path, e):
+            print(f"⚠️ Skipping image {os.path.basename(img_path)}: {e}")
+            failed_images.append(img_path)
+
+        return _single_pass_slideshow(plan(), audio_path, duration_per_image, output_path or "slideshow_effects.mp4", transition, on_error)
+
     # Create temp directory for processing
     temp_dir = os.path.join(os.path.dirname(image_paths[0]), "temp_slideshow")
     if os.path.exists(temp_dir):
@@ -698,12 +896,7 @@ def images_to_video(image_paths, audio_path, duration_per_image=3.0, output_path
         
         print(f"🔄 Audio duration: {audio_duration:.1f}s - Need {clips_needed} clips at {duration_per_image}s each")
         
-        fps = 30
-        total_frames = int(duration_per_image * fps)
-        output_size = (1920, 1080)
-        
-        # Ken Burns effect types
-        effects = ['zoom_in', 'zoom_out', 'pan_left', 'pan_right', 'pan_up', 'pan_down']
+        fps = FPS
         
         clips = []
         failed_images = []
@@ -713,129 +906,33 @@ def images_to_video(image_paths, audio_path, duration_per_image=3.0, output_path
         # Keep looping through images until we have enough successful clips
         img_cycle_index = 0
         clip_count = 0
+        occurrences = {}
         
         while len(clips) < clips_needed:
-            # Get the next image (cycling through the list)
-            img_path = image_paths[img_cycle_index % len(image_paths)]
-            img_cycle_index += 1
-            
-            # Skip if this image previously failed
-            if img_path in failed_images:
-                continue
-            
-            try:
-                # Load and prepare image at high resolution for quality
-                with Image.open(img_path) as img:
-                    img = img.convert('RGB')
-                    
-                    # Upscale to 2560x1440 for better quality when zooming
-                    target_size = (2560, 1440)
-                    ratio = min(target_size[0] / img.width, target_size[1] / img.height)
-                    new_size = (int(img.width * ratio), int(img.height * ratio))
-                    img = img.resize(new_size, Image.Resampling.LANCZOS)
-                    
-                    # Center on black background
-                    canvas = Image.new('RGB', target_size, (0, 0, 0))
-                    x = (target_size[0] - new_size[0]) // 2
-                    y = (target_size[1] - new_size[1]) // 2
-                    canvas.paste(img, (x, y))
-                    
-                    # Choose random effect
-                    effect = random.choice(effects)
-                    
-                    # Create frames directory for this clip
-                    frames_dir = os.path.join(temp_dir, f"frames_{clip_count:05d}")
-                    os.makedirs(frames_dir, exist_ok=True)
-                    
-                    # Generate frames with Ken Burns effect
-                    for frame_num in range(total_frames):
-                        t = frame_num / (total_frames - 1)  # 0.0 to 1.0
-                        
-                        if effect == 'zoom_in':
-                            # Zoom from 1.0x to 1.1x (slower, more subtle)
-                            zoom = 1.0 + (0.1 * t)
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = (target_size[0] - crop_w) // 2
-                            crop_y = (target_size[1] - crop_h) // 2
-                            
-                        elif effect == 'zoom_out':
-                            # Zoom from 1.1x to 1.0x (slower, more subtle)
-                            zoom = 1.1 - (0.1 * t)
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = (target_size[0] - crop_w) // 2
-                            crop_y = (target_size[1] - crop_h) // 2
-                            
-                        elif effect == 'pan_left':
-                            # Pan from right to left (slower)
-                            zoom = 1.05
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = int((target_size[0] - crop_w) * (1 - t))
-                            crop_y = (target_size[1] - crop_h) // 2
-                            
-                        elif effect == 'pan_right':
-                            # Pan from left to right (slower)
-                            zoom = 1.05
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = int((target_size[0] - crop_w) * t)
-                            crop_y = (target_size[1] - crop_h) // 2
-                            
-                        elif effect == 'pan_up':
-                            # Pan from bottom to top (slower)
-                            zoom = 1.05
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = (target_size[0] - crop_w) // 2
-                            crop_y = int((target_size[1] - crop_h) * (1 - t))
-                            
-                        else:  # pan_down
-                            # Pan from top to bottom (slower)
-                            zoom = 1.05
-                            crop_w = int(output_size[0] / zoom)
-                            crop_h = int(output_size[1] / zoom)
-                            crop_x = (target_size[0] - crop_w) // 2
-                            crop_y = int((target_size[1] - crop_h) * t)
-                        
-                        # Crop and resize to output size
-                        cropped = canvas.crop((crop_x, crop_y, crop_x + crop_w, crop_y + crop_h))
-                        frame = cropped.resize(output_size, Image.Resampling.LANCZOS)
-                        
-                        # Save frame
-                        frame_path = os.path.join(frames_dir, f"frame_{frame_num:05d}.jpg")
-                        frame.save(frame_path, "JPEG", quality=95)
-                    
-                    # Encode frames to video clip
-                    clip_path = os.path.join(temp_dir, f"clip_{clip_count:05d}.mp4")
-                    cmd = [
-                        "ffmpeg", "-y",
-                        "-framerate", str(fps),
-                        "-i", os.path.join(frames_dir, "frame_%05d.jpg"),
-                        "-c:v", "libx264",
-                        "-pix_fmt", "yuv420p",
-                        "-r", str(fps),
-                        clip_path
-                    ]
-                    
-                    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                    
-                    if os.path.exists(clip_path):
-                        clips.append(clip_path)
-                        clip_count += 1
-                        print(f"  ✓ Clip {len(clips)}/{clips_needed} rendered")
-                    
-                    # Clean up frames
-                    shutil.rmtree(frames_dir)
-                    
-            except Exception as e:
-                print(f"⚠️ Skipping image {os.path.basename(img_path)}: {e}")
-                failed_images.append(img_path)
-                # If all images have failed, we can't continue
-                if len(failed_images) >= len(image_paths):
-                    print("❌ Error: All images failed to process.")
-                    return None
+            # Plan the missing clips (cycling through the list), skipping images that failed
+            jobs = []
+            while len(jobs) < clips_needed - len(clips):
+                img_path = image_paths[img_cycle_index % len(image_paths)]
+                img_cycle_index += 1
+                if img_path in failed_images:
+                    continue
+                clip_path = os.path.join(temp_dir, f"clip_{clip_count:05d}.mp4")
+                occurrence = occurrences.get(img_path, 0)
+                occurrences[img_path] = occurrence + 1
+                jobs.append((img_path, effect_for(img_path, occurrence, seed), clip_path))
+                clip_count += 1
+
+            for (img_path, _, _), (clip_path, error) in zip(jobs, render_clips(jobs, duration_per_image, fps, workers, cache=get_clip_cache())):
+                if clip_path and os.path.exists(clip_path):
+                    clips.append(clip_path)
+                elif img_path not in failed_images:
+                    print(f"⚠️ Skipping image {os.path.basename(img_path)}: {error}")
+                    failed_images.append(img_path)
+
+            # If all images have failed, we can't continue
+            if len(failed_images) >= len(image_paths):
+                print("❌ Error: All images failed to process.")
+                return None
 
         if failed_images:
             print(f"⚠️ Skipped {len(failed_images)} images that could not be processed")
@@ -847,11 +944,11 @@ def images_to_video(image_paths, audio_path, duration_per_image=3.0, output_path
             print("❌ Error: No clips were generated.")
             return None
 
-        # Concatenate Clips
+        # Concatenate Clips (reused ones live in the render cache, so paths are absolute)
         concat_list_path = os.path.join(temp_dir, "concat.txt")
         with open(concat_list_path, "w") as f:
             for clip in clips:
-                f.write(f"file '{os.path.basename(clip)}'\n")
+                f.write(f"file '{concat_entry(clip)}'\n")
         
         if not output_path:
             filename_no_ext = "slideshow_effects"
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+import subprocess
+
+from utils.download import select_format, download_format, safe_filename
+from utils.formats import choose_format
+from utils.media import check_ffmpeg_installed, parse_time
+
+# Protocols ffmpeg can read directly from the source URL
+STREAMABLE_PROTOCOLS = ('http', 'https', 'm3u8', 'm3u8_native')
+
+def can_stream(fmt):
+    """Returns True if ffmpeg can read this yt-dlp format straight from its URL."""
+    return bool(fmt and fmt.get('url') and (fmt.get('protocol') or 'https') in STREAMABLE_PROTOCOLS)
+
+def _ffmpeg_input_args(fmt):
+    args = []
+    headers = fmt.get('http_headers') or {}
+    if headers:
+        args += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    if (fmt.get('protocol') or 'https') in ('http', 'https'):
+        # Long single-request downloads should survive dropped connections
+        args += ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5"]
+    return args + ["-i", fmt['url']]
+
+def _video_stream_format(info, target_height=None):
+    choice = choose_format(info, target_height)
+    if choice['video'] and choice['video'].get('url'):
+        return choice['video']
+    selected = select_format(info, choice['format']) or {}
+    for fmt in selected.get('requested_formats') or [selected]:
+        if fmt.get('vcodec') != 'none':
+            return fmt
+    return None
+
+def stream_mute(info, output_path=None, target_height=None):
+    """
+    Creates a muted video in one ffmpeg pass that reads the video stream straight
+    from the source, so no full download or merged intermediate is written.
+
+    Args:
+        info (dict): Info dict from fetch_video_info().
+        output_path (str, optional): Output path. Defaults to <title>_muted.mp4
+        target_height (int, optional): Preferred video height. None = best quality.
+
+    Returns:
+        str: Path to the muted video, or None if failed/not streamable (caller should fall back).
+    """
+    if not check_ffmpeg_installed():
+        print("❌ Error: FFmpeg not installed.")
+        return None
+
+    fmt = _video_stream_format(info, target_height)
+    if not can_stream(fmt):
+        print("ℹ️ Source cannot be streamed into ffmpeg; falling back to download + mute.")
+        return None
+
+    if not output_path:
+        output_path = f"{safe_filename(info.get('title'))}_muted.mp4"
+
+    print(f"🔇 Streaming video into ffmpeg (mute, single pass)...")
+    try:
+        cmd = ["ffmpeg", "-y"] + _ffmpeg_input_args(fmt) + [
+            "-map", "0:v:0",
+            "-c", "copy",
+            "-an",
+            output_path
+        ]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        if os.path.exists(output_path):
+            return output_path
+        return None
+    except Exception as e:
+        print(f"❌ Error streaming mute: {e}")
+        return None
+
+def stream_loop(info, target_duration_str, output_path=None, target_height=None):
+    """
+    Loops a video to the target duration, downloading the source only once.
+
+    Re-reading a remote source once per loop would multiply network traffic, so the
+    full video and audio streams are downloaded to a temp folder next to the output,
+    stream-copied into one merged temp file cut to the shorter stream, and that file is
+    looped. Looping the merged file (rather than each stream on its own) keeps audio and
+    video restarting together, so they cannot drift apart at each loop boundary.
+
+    Args:
+        info (dict): Info dict from fetch_video_info().
+        target_duration_str (str): Duration string (e.g., "1h", "30m", "10s").
+        output_path (str, optional): Output path. Defaults to <title>_looped.mp4
+        target_height (int, optional): Preferred video height. None = best quality.
+
+    Returns:
+        str: Path to the looped video, or None if failed.
+    """
+    if not check_ffmpeg_installed():
+        print("❌ Error: FFmpeg not installed.")
+        return None
+
+    total_seconds = parse_time(target_duration_str)
+    if total_seconds is None:
+        print(f"❌ Invalid duration format: {target_duration_str}")
+        return None
+
+    if not output_path:
+        output_path = f"{safe_filename(info.get('title'))}_looped.mp4"
+
+    choice = choose_format(info, target_height)
+    temp_dir = tempfile.mkdtemp(prefix="ytdlr_loop_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        if choice['video'] is not None and choice['video'] is not choice['audio']:
+            video_file = download_format(info, choice['video']['format_id'], os.path.join(temp_dir, "video"))
+            audio_file = download_format(info, choice['audio']['format_id'], os.path.join(temp_dir, "audio"))
+        else:
+            video_file = audio_file = download_format(info, choice['format'], os.path.join(temp_dir, "av"))
+        if not video_file or not audio_file:
+            print("❌ Error: Could not download source streams.")
+            return None
+
+        source = video_file
+        if audio_file != video_file:
+            print("🔗 Merging video and audio streams...")
+            source = os.path.join(temp_dir, "merged.mkv")
+            cmd = [
+                "ffmpeg", "-y",
+                "-i", video_file,
+                "-i", audio_file,
+                "-map", "0:v:0",
+                "-map", "1:a:0",
+                "-c", "copy",
+                "-shortest",
+                source
+            ]
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        print(f"🔄 Looping to {total_seconds}s...")
+        cmd = [
+            "ffmpeg", "-y",
+            "-stream_loop", "-1", "-i", source,
+            "-t", str(total_seconds),
+            "-map", "0:v:0",
+            "-map", "0:a:0",
+            "-c", "copy",
+            output_path
+        ]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        if os.path.exists(output_path):
+            return output_path
+        return None
+    except Exception as e:
+        print(f"❌ Error looping video: {e}")
+        return None
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,126 @@
+import sys
+import json
+import time
+import urllib.parse
+
+# Event types emitted by ProgressReporter
+EVENT_DOWNLOAD = 'download'             # bytes/speed/ETA/fragment update for one stream
+EVENT_DOWNLOAD_FINISHED = 'download_finished'
+EVENT_MERGE = 'merge'                   # merging video+audio into the final container
+EVENT_POSTPROCESS = 'postprocess'       # any other yt-dlp post-processor
+EVENT_ERROR = 'error'
+
+class ProgressReporter:
+    """
+    Turns yt-dlp's progress/post-processor hook dicts into flat, typed events and
+    passes them to a callback. Events are plain JSON-serialisable dicts with a
+    'type' key (see EVENT_* above), so the same stream can drive a UI progress bar
+    or be written out as JSON lines.
+    """
+    def __init__(self, callback, min_interval=0.5):
+        """
+        Args:
+            callback (func): Called with each event dict.
+            min_interval (float): Minimum seconds between 'download' events per stream.
+                                  Finished/merge/error events are never throttled.
+        """
+        self.callback = callback
+        self.min_interval = min_interval
+        self._last_emit = {}
+
+    def attach(self, ydl_opts):
+        """Returns a copy of `ydl_opts` with this reporter's hooks added."""
+        return dict(
+            ydl_opts,
+            progress_hooks=list(ydl_opts.get('progress_hooks', [])) + [self.progress_hook],
+            postprocessor_hooks=list(ydl_opts.get('postprocessor_hooks', [])) + [self.postprocessor_hook],
+        )
+
+    def _emit(self, event):
+        event['time'] = time.time()
+        try:
+            self.callback(event)
+        except Exception as e:
+            # A broken consumer must never abort the download
+            print(f"⚠️ Progress callback failed: {e}", file=sys.stderr)
+
+    def progress_hook(self, d):
+        info = d.get('info_dict') or {}
+        url = info.get('url') or ''
+        event = {
+            'id': info.get('id'),
+            'title': info.get('title'),
+            'format_id': info.get('format_id'),
+            'host': urllib.parse.urlsplit(url).netloc or None,
+            'filename': d.get('filename'),
+            'downloaded_bytes': d.get('downloaded_bytes'),
+            'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+            'speed': d.get('speed'),
+            'eta': d.get('eta'),
+            'elapsed': d.get('elapsed'),
+            'fragment_index': d.get('fragment_index'),
+            'fragment_count': d.get('fragment_count'),
+        }
+        if event['downloaded_bytes'] and event['total_bytes']:
+            event['percent'] = min(100.0, 100.0 * event['downloaded_bytes'] / event['total_bytes'])
+        elif event['fragment_index'] and event['fragment_count']:
+            event['percent'] = min(100.0, 100.0 * event['fragment_index'] / event['fragment_count'])
+        else:
+            event['percent'] = None
+
+        status = d.get('status')
+        if status == 'downloading':
+            now = time.time()
+            stream = d.get('filename')
+            if now - self._last_emit.get(stream, 0.0) < self.min_interval:
+                return
+            self._last_emit[stream] = now
+            event['type'] = EVENT_DOWNLOAD
+        elif status == 'finished':
+            event['type'] = EVENT_DOWNLOAD_FINISHED
+        else:
+            event['type'] = EVENT_ERROR
+        self._emit(event)
+
+    def postprocessor_hook(self, d):
+        info = d.get('info_dict') or {}
+        name = d.get('postprocessor')
+        self._emit({
+            'type': EVENT_MERGE if name == 'Merger' else EVENT_POSTPROCESS,
+            'status': d.get('status'),
+            'postprocessor': name,
+            'id': info.get('id'),
+            'title': info.get('title'),
+        })
+
+def json_lines_sink(stream):
+    """
+    Returns a callback that writes each event as one JSON line to `stream`.
+    Use a stream of its own: stdout and stderr also carry printed messages and warnings.
+    """
+    def write(event):
+        stream.write(json.dumps(event) + "\n")
+        stream.flush()
+    return write
+
+def format_event(event):
+    """Short human-readable summary of an event, for status lines."""
+    kind = event.get('type')
+    if kind == EVENT_DOWNLOAD:
+        parts = []
+        if event.get('percent') is not None:
+            parts.append(f"{event['percent']:.1f}%")
+        if event.get('speed'):
+            parts.append(f"{event['speed'] / (1024 * 1024):.2f} MB/s")
+        if event.get('eta') is not None:
+            parts.append(f"ETA {event['eta']}s")
+        if event.get('fragment_index') and event.get('fragment_count'):
+            parts.append(f"fragment {event['fragment_index']}/{event['fragment_count']}")
+        return "⬇️ Downloading " + " · ".join(parts)
+    if kind == EVENT_DOWNLOAD_FINISHED:
+        return "✅ Stream downloaded"
+    if kind == EVENT_MERGE:
+        return "🔗 Merging video and audio..." if event.get('status') != 'finished' else "🔗 Merge complete"
+    if kind == EVENT_POSTPROCESS:
+        return f"⚙️ {event.get('postprocessor')} {event.get('status')}"
+    return "❌ Download error"
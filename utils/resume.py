@@ -0,0 +1,135 @@
+import os
+import re
+import glob
+import time
+import hashlib
+
+from utils.cache import DiskCache, DEFAULT_CACHE_DIR
+
+# How often (seconds) progress is flushed to the state store while downloading
+STATE_FLUSH_INTERVAL = 2.0
+
+_state_store = None
+
+def get_state_store():
+    """Returns the process-wide store of download states (keyed by absolute output path)."""
+    global _state_store
+    if _state_store is None:
+        _state_store = DiskCache(os.path.join(DEFAULT_CACHE_DIR, "downloads"), max_entries=1000)
+    return _state_store
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def partial_files(output_path):
+    """Lists yt-dlp's intermediate files for an output (per-format streams, .part and .ytdl files)."""
+    base = os.path.splitext(output_path)[0]
+    # Only <base>.f<format id>.<ext> streams and <output>.part/.ytdl (plus their -Frag pieces),
+    # never unrelated files that share the name, such as <base>.flac
+    pattern = re.compile(
+        re.escape(os.path.basename(base)) + r"\.f\d+\.[^.]+(\.(part(-Frag\d+)?|ytdl))?$"
+        + "|" + re.escape(os.path.basename(output_path)) + r"\.(part(-Frag\d+)?|ytdl)$"
+    )
+    candidates = glob.glob(glob.escape(base) + ".*")
+    return sorted(p for p in candidates if p != output_path and pattern.match(os.path.basename(p)))
+
+class DownloadState:
+    """
+    Tracks one download (URL, format, expected size, fragment progress) on disk so an
+    interrupted download resumes from yt-dlp's .part/.ytdl files instead of restarting,
+    and a finished file is only reused after its size and hash check out.
+    """
+    def __init__(self, url, format_str, output_path, expected_size=None, store=None):
+        self.url = url
+        self.format_str = format_str
+        self.output_path = output_path
+        self.expected_size = expected_size
+        self.store = store or get_state_store()
+        self.key = os.path.abspath(output_path)
+        self._last_flush = 0.0
+        self._streams = {}
+
+    def _load(self):
+        return self.store.get(self.key)
+
+    def _save(self, record):
+        self.store.set(self.key, record)
+
+    def check(self):
+        """
+        Decides what to do before downloading, cleaning up anything that cannot be trusted.
+
+        Returns:
+            str: 'complete' (verified file can be reused), 'resume' (matching partial
+                 download exists) or 'new'.
+        """
+        record = self._load()
+        same_job = record and record.get('url') == self.url and record.get('format') == self.format_str
+
+        if same_job and record.get('status') == 'complete' and self.verify(record):
+            return 'complete'
+
+        if same_job and record.get('status') == 'downloading' and partial_files(self.output_path):
+            return 'resume'
+
+        # Unverified final file or partials from another URL/format: start over
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+        for path in partial_files(self.output_path):
+            os.remove(path)
+        self._save({
+            'url': self.url,
+            'format': self.format_str,
+            'output': self.output_path,
+            'expected_size': self.expected_size,
+            'status': 'downloading',
+            'started_at': time.time(),
+            'streams': {},
+        })
+        return 'new'
+
+    def verify(self, record=None):
+        """Returns True if the output file matches the recorded size and SHA-256."""
+        record = record or self._load()
+        if not record or not os.path.exists(self.output_path):
+            return False
+        if os.path.getsize(self.output_path) != record.get('size'):
+            return False
+        return file_checksum(self.output_path) == record.get('sha256')
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook: records bytes and fragment progress per stream."""
+        filename = d.get('filename') or d.get('tmpfilename')
+        if not filename:
+            return
+        self._streams[os.path.basename(filename)] = {
+            'status': d.get('status'),
+            'downloaded_bytes': d.get('downloaded_bytes'),
+            'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+            'fragment_index': d.get('fragment_index'),
+            'fragment_count': d.get('fragment_count'),
+        }
+
+        now = time.time()
+        if d.get('status') == 'finished' or now - self._last_flush >= STATE_FLUSH_INTERVAL:
+            self._last_flush = now
+            record = self._load() or {}
+            record.setdefault('streams', {}).update(self._streams)
+            record['updated_at'] = now
+            self._save(record)
+
+    def mark_complete(self):
+        """Records the final size and hash of the finished output."""
+        record = self._load() or {'url': self.url, 'format': self.format_str, 'output': self.output_path}
+        record['status'] = 'complete'
+        record['size'] = os.path.getsize(self.output_path)
+        record['sha256'] = file_checksum(self.output_path)
+        record['completed_at'] = time.time()
+        self._save(record)
+        if self.expected_size and abs(record['size'] - self.expected_size) > self.expected_size * 0.1:
+            print(f"⚠️ {os.path.basename(self.output_path)}: size {record['size']} differs from expected {self.expected_size}")
@@ -0,0 +1,489 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import threading
+import contextlib
+import subprocess
+
+try:
+    import fcntl
+except ImportError:  # Windows: chunked jobs run without cross-run resume
+    fcntl = None
+
+from utils.cache import DiskCache, DEFAULT_CACHE_DIR
+
+# Demucs model used for vocal removal (same as the `demucs -n htdemucs` CLI default)
+DEFAULT_MODEL = "htdemucs"
+# MP3 settings matching `demucs --mp3` (320 kbps, LAME preset 2)
+MP3_BITRATE = 320
+MP3_PRESET = 2
+
+# Chunked (bounded-memory) separation: window length and cross-faded overlap, in seconds
+CHUNK_SECONDS = 60.0
+CHUNK_OVERLAP_SECONDS = 2.0
+CHECKPOINT_FILENAME = "checkpoint.json"
+# Inputs at least this long are separated in chunks
+CHUNKED_MIN_SECONDS = 600
+# Checkpoints of chunked jobs, kept between runs so a crashed job can resume
+CHUNK_STATE_DIR = os.path.join(DEFAULT_CACHE_DIR, "chunks")
+
+# Disk quota for cached stems (least recently used stems are evicted first)
+STEM_CACHE_MAX_BYTES = int(os.environ.get("YTDLR_STEM_CACHE_MB", "2048")) * 1024 * 1024
+# Decoded form hashed for stem cache keys, so remuxes of the same audio still hit (a lossy
+# re-encode or a different download format changes the samples, and so the key)
+FINGERPRINT_SAMPLERATE = 44100
+FINGERPRINT_CHANNELS = 2
+
+# Speed/quality trade-offs for CPU inference; 'balanced' is the demucs CLI default.
+# shifts = random time shifts averaged per prediction, overlap = between the model's
+# segments, quantize = int8 dynamic quantization of the Linear (transformer) layers.
+# htdemucs cannot use segments longer than its 7.8s training length and shorter ones
+# only add overlap work, so segment stays at the model default.
+SEPARATION_PRESETS = {
+    'fast': {'shifts': 0, 'overlap': 0.1, 'quantize': True},
+    'balanced': {'shifts': 1, 'overlap': 0.25, 'quantize': False},
+    'quality': {'shifts': 2, 'overlap': 0.5, 'quantize': False},
+}
+DEFAULT_PRESET = 'balanced'
+
+_cpu_threads = None
+
+def _available_cpus():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+def pin_cpu_threads(threads=None):
+    """
+    Sets the OpenMP/MKL environment for CPU inference: `threads` threads (default: the
+    CPUs this process may run on), pinned to cores so they don't migrate mid-inference.
+
+    libgomp reads these variables once, when torch is first imported, so this must run
+    before that: at program start, or in a spawned worker before it loads a model.
+    Processes that share a machine should first be given disjoint CPU sets
+    (os.sched_setaffinity), as the places are taken from the process's affinity.
+
+    Returns:
+        bool: False if torch was already imported (nothing changed).
+    """
+    if "torch" in sys.modules:
+        return False
+    threads = threads or _available_cpus()
+    os.environ.setdefault("OMP_PROC_BIND", "close")
+    os.environ.setdefault("OMP_PLACES", "cores")
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    return True
+
+def configure_cpu_threads(threads=None):
+    """
+    Sets torch's CPU thread pools once per process: `threads` intra-op threads
+    (default: the CPUs this process may run on) and a single inter-op thread.
+    Core pinning is set up separately, before torch loads (see pin_cpu_threads).
+
+    Returns:
+        int: Intra-op thread count in use.
+    """
+    global _cpu_threads
+    if threads is None:
+        if _cpu_threads is not None:
+            return _cpu_threads
+        threads = _available_cpus()
+
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Fixed once any inter-op work has run
+    _cpu_threads = threads
+    return threads
+
+def default_device():
+    """Returns 'cuda' when a GPU is available, else 'cpu'. Does not initialise CUDA."""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+class SeparationEngine:
+    """
+    Keeps one Demucs model loaded in this process so separation jobs skip the
+    interpreter start, torch import and weight loading the `demucs` CLI pays per file.
+
+    Jobs are serialised with a lock: the model is shared, and a single job already
+    uses every CPU core.
+    """
+    def __init__(self, model_name=DEFAULT_MODEL, device=None, preset=DEFAULT_PRESET, segment=None):
+        """
+        Args:
+            model_name (str): Pretrained Demucs model name.
+            device (str, optional): Torch device. Defaults to 'cuda' when available, else 'cpu'.
+            preset (str): Key of SEPARATION_PRESETS.
+            segment (float, optional): Segment length in seconds. None = model default.
+        """
+        if preset not in SEPARATION_PRESETS:
+            raise ValueError(f"Unknown preset '{preset}' (choose from {', '.join(SEPARATION_PRESETS)})")
+        self.model_name = model_name
+        self.device = device
+        self.preset = preset
+        self.shifts = SEPARATION_PRESETS[preset]['shifts']
+        self.overlap = SEPARATION_PRESETS[preset]['overlap']
+        self.quantize = SEPARATION_PRESETS[preset]['quantize']
+        self.segment = segment
+        self._model = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        """Loads the model (once). Returns the model."""
+        with self._load_lock:
+            if self._model is None:
+                import torch
+                from demucs.pretrained import get_model
+
+                if self.device is None:
+                    self.device = default_device()
+                if self.device == "cpu":
+                    configure_cpu_threads()
+                model = get_model(self.model_name)
+                model.to(self.device)
+                model.eval()
+                if self.quantize and self.device == "cpu":
+                    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                self._model = model
+        return self._model
+
+    @property
+    def cache_tag(self):
+        """Identifies this model + preset in cache keys (presets give different stems)."""
+        return self.model_name if self.preset == DEFAULT_PRESET else f"{self.model_name}-{self.preset}"
+
+    @property
+    def samplerate(self):
+        return self.load().samplerate
+
+    @property
+    def sources(self):
+        return list(self.load().sources)
+
+    def read_audio(self, input_path):
+        """Decodes the first audio stream of a file to a (channels, samples) tensor at the model's rate."""
+        from demucs.audio import AudioFile
+
+        model = self.load()
+        return AudioFile(input_path).read(streams=0, samplerate=model.samplerate, channels=model.audio_channels)
+
+    def separate_tensor(self, wav, two_stems=None):
+        """
+        Separates a (channels, samples) tensor.
+
+        Args:
+            wav (Tensor): Audio at the model's sample rate and channel count.
+            two_stems (str, optional): Keep only this stem plus 'no_<stem>' (the sum of the
+                                       others), like `demucs --two-stems`.
+
+        Returns:
+            dict: Stem name -> (channels, samples) tensor.
+        """
+        import torch
+        from demucs.apply import apply_model
+
+        model = self.load()
+        # Same normalisation as the demucs CLI
+        ref = wav.mean(0)
+        mean, std = ref.mean(), ref.std()
+        if std < 1e-8:
+            std = 1.0  # silent input
+        wav = (wav - mean) / std
+        with self._lock, torch.inference_mode():
+            out = apply_model(model, wav[None], device=self.device, shifts=self.shifts, split=True,
+                              overlap=self.overlap, segment=self.segment, progress=False)[0]
+        out = out * std + mean
+
+        stems = dict(zip(model.sources, out))
+        if two_stems:
+            if two_stems not in stems:
+                raise ValueError(f"Model {self.model_name} has no '{two_stems}' stem")
+            rest = sum(stem for name, stem in stems.items() if name != two_stems)
+            stems = {two_stems: stems[two_stems], f"no_{two_stems}": rest}
+        return stems
+
+    def separate_file(self, input_path, two_stems=None):
+        """Decodes and separates a file. Returns stem name -> tensor (see separate_tensor)."""
+        return self.separate_tensor(self.read_audio(input_path), two_stems=two_stems)
+
+    def save_stems(self, stems, output_dir, ext="mp3"):
+        """
+        Writes stems as `<output_dir>/<stem>.<ext>` (mp3 or wav).
+
+        Returns:
+            dict: Stem name -> file path.
+        """
+        from demucs.audio import save_audio
+
+        os.makedirs(output_dir, exist_ok=True)
+        paths = {}
+        for name, wav in stems.items():
+            path = os.path.join(output_dir, f"{name}.{ext}")
+            save_audio(wav.cpu(), path, samplerate=self.samplerate, bitrate=MP3_BITRATE,
+                       preset=MP3_PRESET, clip="rescale")
+            paths[name] = path
+        return paths
+
+    def separate_to_files(self, input_path, output_dir, two_stems=None, ext="mp3", keep=None):
+        """
+        Separates a file and writes its stems to `output_dir`.
+
+        Args:
+            keep (iterable, optional): Stem names to write. None = all; others are never encoded.
+
+        Returns:
+            dict: Stem name -> file path.
+        """
+        stems = self.separate_file(input_path, two_stems=two_stems)
+        if keep is not None:
+            stems = {name: wav for name, wav in stems.items() if name in keep}
+        return self.save_stems(stems, output_dir, ext=ext)
+
+    def separate_chunked(self, input_path, output_dir, two_stems=None, ext="mp3", work_dir=None,
+                         chunk_seconds=CHUNK_SECONDS, overlap_seconds=CHUNK_OVERLAP_SECONDS, progress_callback=None,
+                         source_id=None, keep=None):
+        """
+        Separates a long file with memory bounded by the window size, not the input length.
+
+        Audio is decoded by ffmpeg one window at a time; consecutive windows overlap and are
+        linearly cross-faded. Finished samples are appended to raw PCM spool files per stem,
+        and a checkpoint is written after every window, so a crashed job started again with
+        the same `work_dir` continues from the last finished window. The spools are encoded
+        once at the end.
+
+        Args:
+            input_path (str): Audio or video file.
+            output_dir (str): Folder for `<stem>.<ext>` files.
+            two_stems (str, optional): See separate_tensor.
+            ext (str): 'mp3' or 'wav'.
+            work_dir (str, optional): Spool/checkpoint folder. Defaults to `<output_dir>/.chunks`.
+            chunk_seconds (float): Window length.
+            overlap_seconds (float): Cross-fade length between windows.
+            progress_callback (func, optional): Called with a status message per window.
+            source_id (str, optional): Identifies the audio for resuming (e.g. audio_fingerprint()),
+                                       for inputs that are temporary copies. Defaults to the
+                                       input's path, size and mtime.
+            keep (iterable, optional): Stem names to write. None = all; others are never spooled or encoded.
+
+        Returns:
+            dict: Stem name -> file path.
+        """
+        import numpy as np
+        import torch
+
+        model = self.load()
+        sr, channels = model.samplerate, model.audio_channels
+        chunk = int(chunk_seconds * sr)
+        overlap = min(int(overlap_seconds * sr), chunk // 2)
+        step = chunk - overlap
+
+        work_dir = work_dir or os.path.join(output_dir, ".chunks")
+        os.makedirs(work_dir, exist_ok=True)
+        if source_id is None:
+            stat = os.stat(input_path)
+            source_id = [os.path.abspath(input_path), stat.st_size, stat.st_mtime]
+        job = {
+            'source': source_id, 'model': self.cache_tag, 'two_stems': two_stems,
+            'keep': sorted(keep) if keep is not None else None, 'chunk': chunk, 'overlap': overlap,
+        }
+        state = _load_checkpoint(work_dir)
+        if not state or state.get('job') != job:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir)
+            state = {'job': job, 'next_chunk': 0, 'bytes': {}, 'peak': {}, 'done': False}
+        elif state['next_chunk']:
+            log = progress_callback or print
+            log(f"⏩ Resuming separation at window {state['next_chunk'] + 1}")
+
+        # The overlap still to be cross-faded into window N is kept in tail_<N>.npz;
+        # a finished checkpoint has no tail left and goes straight to encoding
+        index = state['next_chunk']
+        tail_path = os.path.join(work_dir, f"tail_{index}.npz")
+        tail = dict(np.load(tail_path)) if index and os.path.exists(tail_path) else None
+        if index and tail is None and not state['done']:
+            raise RuntimeError(f"Checkpoint in {work_dir} is missing its overlap; delete the folder to start over")
+
+        while not state['done']:
+            wav = decode_window(input_path, index * step / sr, chunk / sr, sr, channels)
+            last = wav.shape[1] < chunk
+            if wav.shape[1] == 0:
+                if tail is None:
+                    raise RuntimeError(f"No audio decoded from {input_path}")
+                out = tail
+            else:
+                stems = self.separate_tensor(torch.from_numpy(wav), two_stems=two_stems)
+                out, new_tail = {}, {}
+                for name, stem in stems.items():
+                    if keep is not None and name not in keep:
+                        continue
+                    stem = stem.cpu().numpy()
+                    if tail is not None:
+                        n = min(overlap, stem.shape[1])
+                        fade = np.linspace(0.0, 1.0, n, dtype=np.float32)
+                        stem[:, :n] = tail[name][:, :n] * (1.0 - fade) + stem[:, :n] * fade
+                    if last:
+                        out[name] = stem
+                    else:
+                        out[name], new_tail[name] = stem[:, :-overlap], stem[:, -overlap:]
+                tail = new_tail
+
+            for name, stem in out.items():
+                spool = os.path.join(work_dir, f"{name}.f32")
+                with open(spool, "ab") as f:
+                    f.truncate(state['bytes'].get(name, 0))  # drop anything written after the last checkpoint
+                    f.write(np.ascontiguousarray(stem.T, dtype="<f4").tobytes())
+                    state['bytes'][name] = f.tell()
+                state['peak'][name] = max(state['peak'].get(name, 0.0), float(np.abs(stem).max(initial=0.0)))
+
+            if not last:
+                np.savez(os.path.join(work_dir, f"tail_{index + 1}.npz"), **tail)
+            state['next_chunk'] = index + 1
+            state['done'] = last
+            _save_checkpoint(work_dir, state)
+            if os.path.exists(os.path.join(work_dir, f"tail_{index}.npz")):
+                os.remove(os.path.join(work_dir, f"tail_{index}.npz"))
+            index += 1
+            if progress_callback:
+                progress_callback(f"🎚️ Separated window {index} ({index * step / sr / 60:.1f} min)")
+
+        os.makedirs(output_dir, exist_ok=True)
+        paths = {}
+        for name, peak in state['peak'].items():
+            path = os.path.join(output_dir, f"{name}.{ext}")
+            _encode_spool(os.path.join(work_dir, f"{name}.f32"), path, sr, channels, peak)
+            paths[name] = path
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return paths
+
+def decode_window(input_path, start, duration, samplerate, channels):
+    """Decodes one window of the first audio stream to a float32 (channels, samples) array."""
+    import numpy as np
+
+    cmd = [
+        "ffmpeg", "-v", "error",
+        "-ss", f"{start:.6f}",
+        "-i", input_path,
+        "-t", f"{duration:.6f}",
+        "-map", "0:a:0",
+        "-f", "f32le",
+        "-ac", str(channels),
+        "-ar", str(samplerate),
+        "-"
+    ]
+    raw = subprocess.run(cmd, check=True, capture_output=True).stdout
+    return np.frombuffer(raw, dtype="<f4").reshape(-1, channels).T.copy()
+
+def _encode_spool(spool_path, output_path, samplerate, channels, peak):
+    """Encodes a raw float32 spool, rescaling like demucs' clip='rescale' if it peaks above 1."""
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "f32le", "-ar", str(samplerate), "-ac", str(channels),
+        "-i", spool_path,
+    ]
+    if peak > 1.0:
+        cmd += ["-af", f"volume={1.0 / (1.01 * peak):.6f}"]
+    if output_path.endswith(".mp3"):
+        cmd += ["-c:a", "libmp3lame", "-b:a", f"{MP3_BITRATE}k"]
+    else:
+        # Long stems would pass the 4 GB WAV limit
+        cmd += ["-c:a", "pcm_s16le", "-rf64", "auto"]
+    subprocess.run(cmd + [output_path], check=True)
+
+def _load_checkpoint(work_dir):
+    try:
+        with open(os.path.join(work_dir, CHECKPOINT_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_checkpoint(work_dir, state):
+    path = os.path.join(work_dir, CHECKPOINT_FILENAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+@contextlib.contextmanager
+def resumable_work_dir(job_key, fallback_dir):
+    """
+    Yields the persistent checkpoint folder for `job_key`, locked to this job so two
+    concurrent runs on the same audio never share spools. If another job holds it (or
+    file locking is unavailable), yields `fallback_dir` instead: that run still works,
+    it just cannot be resumed.
+    """
+    path = os.path.join(CHUNK_STATE_DIR, hashlib.sha256(job_key.encode("utf-8")).hexdigest()[:32])
+    if fcntl is None:
+        yield fallback_dir
+        return
+    os.makedirs(CHUNK_STATE_DIR, exist_ok=True)
+    # The lock lives next to the folder: the folder itself is deleted and recreated
+    with open(path + ".lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield fallback_dir
+            return
+        try:
+            yield path
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def audio_fingerprint(input_path):
+    """
+    Returns the SHA-256 of a file's decoded first audio stream (16-bit PCM), or None
+    if it cannot be decoded. Containers, tags and video do not affect the result.
+    """
+    cmd = [
+        "ffmpeg", "-v", "error",
+        "-i", input_path,
+        "-map", "0:a:0",
+        "-f", "s16le",
+        "-ac", str(FINGERPRINT_CHANNELS),
+        "-ar", str(FINGERPRINT_SAMPLERATE),
+        "-"
+    ]
+    h = hashlib.sha256()
+    try:
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+            for chunk in iter(lambda: proc.stdout.read(1024 * 1024), b""):
+                h.update(chunk)
+        if proc.returncode != 0:
+            return None
+    except OSError:
+        return None
+    return h.hexdigest()
+
+def stem_cache_key(fingerprint, model_name, two_stems=None, ext="mp3"):
+    """Cache key for the stems of decoded audio `fingerprint` separated by `model_name`."""
+    return f"stems:{fingerprint}:{model_name}:{two_stems or 'all'}:{ext}"
+
+_stem_cache = None
+
+def get_stem_cache():
+    """Returns the process-wide stem cache."""
+    global _stem_cache
+    if _stem_cache is None:
+        _stem_cache = DiskCache(os.path.join(DEFAULT_CACHE_DIR, "stems"), max_bytes=STEM_CACHE_MAX_BYTES)
+    return _stem_cache
+
+def stem_cache_stats():
+    """Returns hit/miss counts and the size of the stem cache (see DiskCache.stats)."""
+    return get_stem_cache().stats()
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(model_name=DEFAULT_MODEL, preset=DEFAULT_PRESET):
+    """Returns the process-wide engine for `model_name` and `preset` (the model loads on first use)."""
+    with _engines_lock:
+        if (model_name, preset) not in _engines:
+            _engines[(model_name, preset)] = SeparationEngine(model_name, preset=preset)
+        return _engines[(model_name, preset)]
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import threading
+import yt_dlp
+
+from utils.batch import flat_entries, batch_download
+from utils.download import fetch_video_info, download_with_info, build_download_opts, safe_filename, resolve_share_url
+from utils.formats import choose_format
+from utils.resume import file_checksum
+
+ARCHIVE_FILENAME = ".ytdlr_archive.jsonl"
+
+class DownloadArchive:
+    """
+    Append-only record of synced videos, one JSON object per line:
+    {"key", "id", "format_id", "path", "size", "mtime", "sha256", "synced_at"}.
+    The last line for a key wins, so updates never rewrite the file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Tolerate a torn last line from a crashed run
+                    self.records[record['key']] = record
+
+    @staticmethod
+    def key_for(ie_key, video_id):
+        return f"{(ie_key or 'generic').lower()} {video_id}"
+
+    def get(self, key):
+        return self.records.get(key)
+
+    def add(self, key, video_id, format_id, path, sha256=None):
+        """Records a finished download (hashing the file if no checksum is given)."""
+        stat = os.stat(path)
+        record = {
+            'key': key,
+            'id': video_id,
+            'format_id': format_id,
+            'path': path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': sha256 or file_checksum(path),
+            'synced_at': time.time(),
+        }
+        with self._lock:
+            self.records[key] = record
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+    def is_intact(self, key):
+        """
+        Checks that the archived file still exists unchanged.
+        Size and mtime are compared first; the checksum is only recomputed if they differ.
+        """
+        record = self.records.get(key)
+        if not record or not os.path.exists(record['path']):
+            return False
+
+        stat = os.stat(record['path'])
+        if stat.st_size != record['size']:
+            return False
+        if stat.st_mtime == record['mtime']:
+            return True
+        if file_checksum(record['path']) != record['sha256']:
+            return False
+        # Same content, only touched: refresh the record so the next run takes the fast path
+        self.add(key, record['id'], record['format_id'], record['path'], record['sha256'])
+        return True
+
+def sync_source(source, output_dir, archive_path=None, target_height=None, workers=4, per_host=2, progress=None):
+    """
+    Mirrors a playlist/channel into `output_dir`, downloading only new or changed entries.
+
+    The source is listed with flat extraction, so entries already in the archive
+    (with their file intact) never hit the full extractor.
+
+    Args:
+        source (str): Playlist or channel URL.
+        output_dir (str): Directory the videos are mirrored into.
+        archive_path (str, optional): Archive file. Defaults to <output_dir>/.ytdlr_archive.jsonl
+        target_height (int, optional): Preferred video height. None = best quality.
+        workers (int): Maximum concurrent downloads.
+        per_host (int): Maximum concurrent downloads per host.
+        progress (func, optional): Callback receiving progress events (see utils.progress).
+
+    Returns:
+        dict: Batch summary (see batch_download) plus 'skipped' (int).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    archive = DownloadArchive(archive_path or os.path.join(output_dir, ARCHIVE_FILENAME))
+
+    print(f"🔎 Listing {source}...")
+    ydl_opts = {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist'}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        entries = flat_entries(ydl, resolve_share_url(source))
+
+    todo = {}
+    skipped = 0
+    for entry in entries:
+        key = DownloadArchive.key_for(entry['ie_key'], entry['id'] or entry['url'])
+        if archive.is_intact(key):
+            skipped += 1
+            continue
+        todo[entry['url']] = (key, entry['id'])
+
+    print(f"🔄 {len(entries)} entries: {skipped} up to date, {len(todo)} to fetch")
+
+    def job(url):
+        key, video_id = todo[url]
+        info = fetch_video_info(url)
+        video_id = info.get('id') or video_id
+        output_filename = os.path.join(output_dir, f"{safe_filename(info.get('title'))} [{video_id}].mp4")
+        choice = choose_format(info, target_height)
+        ydl_opts = build_download_opts(output_filename, quiet=True, ignoreerrors=False, format_str=choice['format'], progress=progress)
+        if not download_with_info(info, ydl_opts):
+            raise yt_dlp.utils.DownloadError(f"Output file was not created for {url}")
+        archive.add(key, video_id, choice['format'].split('/')[0], output_filename)
+        return output_filename
+
+    if todo:
+        summary = batch_download(list(todo), workers=workers, per_host=per_host, job=job)
+    else:
+        summary = {'completed': {}, 'failed': {}, 'retries': 0, 'elapsed': 0.0}
+        print("✅ Already up to date.")
+
+    summary['skipped'] = skipped
+    return summary